@@ -0,0 +1,65 @@
+"""Microbenchmark of the date handling of the card pipeline.
+
+Compares the dateutil parse that every card used to run on every attribute
+read with the fast path and the once-per-ingest normalization.
+
+    python benchmarks/bench_dates.py [--items 500] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from custom_components.emby_upcoming_media.dates import (  # noqa: E402
+    RELEASE,
+    normalize_dates,
+    parse_datetime,
+    parse_year,
+)
+
+
+def make_items(count):
+    return [
+        {
+            "Id": str(index),
+            "PremiereDate": "20{0:02d}-0{1}-1{2}T00:00:00.0000000Z".format(index % 25, index % 9 + 1, index % 9),
+            "DateCreated": "2024-0{0}-0{1}T12:34:56.1234567Z".format(index % 9 + 1, index % 9 + 1),
+        }
+        for index in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    normalized = normalize_dates(make_items(args.items))
+
+    cases = {
+        "dateutil isoparse (year)": lambda: [
+            str(dateutil.parser.isoparse(item["PremiereDate"]).year) for item in items
+        ],
+        "parse_year": lambda: [str(parse_year(item["PremiereDate"])) for item in items],
+        "dateutil isoparse (DateCreated)": lambda: [
+            dateutil.parser.isoparse(item["DateCreated"]) for item in items
+        ],
+        "parse_datetime (DateCreated)": lambda: [parse_datetime(item["DateCreated"]) for item in items],
+        "make_items + normalize_dates": lambda: normalize_dates(make_items(args.items)),
+        "normalized read": lambda: [item[RELEASE] for item in normalized],
+    }
+
+    print("{0} items, best of {1}".format(args.items, args.repeat))
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print("{0:<34} {1:10.3f} ms {2:8.2f} us/item".format(name, best * 1000, best * 1e6 / args.items))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Benchmark of the sensor pipeline against a local fake Emby server.
+
+Measures, for single and grouped libraries and for the sync and async
+clients: refresh latency of update()/async_update(), cold and cached
+attribute-build time, allocations and peak memory of a refresh round.
+
+    python benchmarks/bench_sensor.py [--libraries 3] [--items 50] [--max 20]
+        [--latency 0.02] [--rounds 5] [--etag] [--save FILE] [--compare FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import aiohttp
+from homeassistant.core import CoreState, callback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_emby import FakeEmbyServer  # noqa: E402
+
+from custom_components.emby_upcoming_media import sensor  # noqa: E402
+
+
+class BenchConfig:
+    def __init__(self, path):
+        self.config_dir = path
+
+    def path(self, *parts):
+        return os.path.join(self.config_dir, *parts)
+
+
+class BenchBus:
+    def __init__(self):
+        self.listeners = []
+
+    def listen_once(self, event_type, listener):
+        self.listeners.append((event_type, listener))
+
+    async_listen_once = listen_once
+
+    def fire(self, event_type):
+        """Call the listeners of event_type, as run_case is done with the clients."""
+        for listened, listener in self.listeners:
+            if listened == event_type:
+                result = listener(None)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+
+
+class BenchHass:
+    """The few parts of Home Assistant used by the platform."""
+
+    def __init__(self, path):
+        self.data = {}
+        self.bus = BenchBus()
+        self.state = CoreState.running
+        self.config = BenchConfig(path)
+        self.loop = asyncio.get_running_loop()
+
+    def add_job(self, target, *args):
+        """Like Home Assistant: callbacks run on the loop, blocking functions in the executor."""
+        if getattr(target, "_hass_callback", False):
+            self.loop.call_soon_threadsafe(target, *args)
+        else:
+            self.loop.call_soon_threadsafe(self.loop.run_in_executor, None, target, *args)
+
+    def async_run_hass_job(self, job, *args):
+        return job.target(*args)
+
+    def async_create_task(self, coro):
+        return asyncio.ensure_future(coro)
+
+    async def async_add_executor_job(self, target, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, target, *args)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+async def run_case(server, args, grouped, use_async, session):
+    hass = BenchHass(tempfile.mkdtemp())
+    sensor.async_get_clientsession = lambda hass: session
+    config = sensor.PLATFORM_SCHEMA(
+        {
+            "platform": "emby_upcoming_media",
+            "api_key": "key",
+            "user_id": "user",
+            "host": server.host,
+            "port": server.port,
+            "max": args.max,
+            "group_libraries": grouped,
+            "async_client": use_async,
+            "snapshot": False,
+            "request_ttl": 0,
+            # Poll every library on every round
+            "min_interval": 0,
+            "max_interval": 0,
+        }
+    )
+
+    sensors = []
+
+    @callback
+    def add_entities(entities, update_before_add=False):
+        sensors.extend(entities)
+
+    start = time.perf_counter()
+    await sensor.async_setup_platform(hass, config, add_entities)
+    await asyncio.sleep(0)
+    setup = time.perf_counter() - start
+    for entity in sensors:
+        entity.hass = hass
+
+    requests = server.requests
+    bytes_sent = server.bytes_sent
+    refresh = []
+    tracemalloc.start()
+    for _round in range(args.rounds):
+        for entity in sensors:
+            start = time.perf_counter()
+            await entity.async_update()
+            refresh.append(time.perf_counter() - start)
+        for entity in sensors:
+            entity.extra_state_attributes
+    snapshot = tracemalloc.take_snapshot()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    cold = []
+    cached = []
+    for entity in sensors:
+        entity._client.card_cache = type(entity._client.card_cache)(entity._client.card_cache.max_size)
+        entity._attributes = None
+        start = time.perf_counter()
+        entity.extra_state_attributes
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        entity.extra_state_attributes
+        cached.append(time.perf_counter() - start)
+
+    hass.bus.fire(sensor.EVENT_HOMEASSISTANT_STOP)
+
+    return {
+        "case": "{0} {1}".format("async" if use_async else "sync", "grouped" if grouped else "single"),
+        "sensors": len(sensors),
+        "setup ms": setup * 1000,
+        "refresh p50 ms": percentile(refresh, 50) * 1000,
+        "refresh p95 ms": percentile(refresh, 95) * 1000,
+        "build ms": statistics.mean(cold) * 1000,
+        "cached us": statistics.mean(cached) * 1e6,
+        "allocs": allocations,
+        "peak KiB": peak / 1024,
+        "requests": (server.requests - requests) / args.rounds,
+        "KiB/round": (server.bytes_sent - bytes_sent) / args.rounds / 1024,
+    }
+
+
+async def main(args):
+    server = FakeEmbyServer(args.libraries, args.items, args.latency, args.etag).start()
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for use_async in (False, True):
+                for grouped in (False, True):
+                    results.append(await run_case(server, args, grouped, use_async, session))
+    finally:
+        server.stop()
+
+    report(args, results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = {result["case"]: result for result in json.load(file)}
+        return compare(baseline, results, args.tolerance)
+    return 0
+
+
+# Lower is better for all of these
+COMPARED = ("refresh p50 ms", "build ms", "allocs", "peak KiB", "requests", "KiB/round")
+
+
+def compare(baseline, results, tolerance):
+    """Print the metrics that got worse than baseline by more than tolerance."""
+    regressions = 0
+    for result in results:
+        before = baseline.get(result["case"])
+        if before is None:
+            continue
+        for column in COMPARED:
+            if before[column] and result[column] > before[column] * (1 + tolerance):
+                regressions += 1
+                print(
+                    "REGRESSION {0}: {1} {2:.2f} -> {3:.2f}".format(
+                        result["case"], column, before[column], result[column]
+                    )
+                )
+    return 1 if regressions else 0
+
+
+def report(args, results):
+    columns = list(results[0])
+    print(
+        "{0} libraries x {1} items, max {2}, latency {3} s, {4} rounds".format(
+            args.libraries, args.items, args.max, args.latency, args.rounds
+        )
+    )
+    print("  ".join("{0:>14}".format(column) for column in columns))
+    for result in results:
+        print(
+            "  ".join(
+                "{0:>14}".format(value if isinstance(value, str) else "{0:.2f}".format(value))
+                for value in result.values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--libraries", type=int, default=3)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--max", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--etag", action="store_true", help="serve ETags and honor If-None-Match")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="fail if worse than the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,214 @@
+"""Local stand-in for the parts of the Emby API used by the integration.
+
+Serves synthetic /Users/{id}/Views, /Users/{id}/Items/Latest and grouped
+/Users/{id}/Items payloads of a
+configurable size, library count and latency from a background thread, and
+pushes LibraryChanged events to the clients of its /embywebsocket endpoint.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+from aiohttp import web
+
+COLLECTION_TYPES = ("movies", "tvshows", "music")
+
+OVERVIEW = (
+    "A synthetic overview, long enough to weigh on the payload like the real "
+    "summaries do when a library is large. "
+) * 4
+
+
+def make_item(library, index, collection_type):
+    """Return one synthetic Latest item of a library."""
+    item = {
+        "Id": "{0}-{1}".format(library, index),
+        "Name": "Item {0} of {1}".format(index, library),
+        "Etag": "e{0}".format(index),
+        "DateCreated": "2024-{0:02d}-{1:02d}T{2:02d}:00:00.0000000Z".format(
+            12 - index // 600 % 12, 28 - index // 24 % 28, 23 - index % 24
+        ),
+        "PremiereDate": "20{0:02d}-01-01T00:00:00.0000000Z".format(index % 25),
+        "ProductionYear": 2000 + index % 25,
+        "RunTimeTicks": 54000000000 + index * 600000000,
+        "CommunityRating": 5 + index % 50 / 10,
+        "Genres": ["Drama", "Comedy", "Action", "Thriller"][: 1 + index % 4],
+        "Overview": OVERVIEW,
+        "Path": "/media/{0}/{1}.mkv".format(library, index),
+        "RemoteTrailers": [{"Url": "https://example.com/trailer/{0}".format(index)}],
+        "Studios": [{"Name": "Studio {0}".format(index % 7), "Id": str(index % 7)}],
+        "ImageTags": {"Primary": "p{0}".format(index), "Backdrop": "b{0}".format(index)},
+    }
+    if collection_type == "movies":
+        item["Type"] = "Movie"
+    elif collection_type == "tvshows":
+        item.update(
+            Type="Episode",
+            SeriesName="Series {0}".format(index % 10),
+            ParentIndexNumber=1 + index % 5,
+            IndexNumber=1 + index % 20,
+            ParentBackdropItemId="{0}-series-{1}".format(library, index % 10),
+        )
+    else:
+        item.update(Type="MusicAlbum", Artists=["Artist {0}".format(index % 13)])
+    return item
+
+
+class FakeEmbyServer:
+    """Fake Emby server running on its own event loop in a background thread."""
+
+    def __init__(self, libraries=3, items=50, latency=0.0, etag=False, collection_type=None, items_query=True):
+        """Init."""
+        self.latency = latency
+        self.etag = etag
+        self.items_query = items_query
+        self.requests = 0
+        self.bytes_sent = 0
+        self.views = [
+            {
+                "Name": "Library {0}".format(index),
+                "Id": "lib{0}".format(index),
+                "CollectionType": collection_type or COLLECTION_TYPES[index % len(COLLECTION_TYPES)],
+            }
+            for index in range(libraries)
+        ]
+        self.items = {
+            view["Id"]: [make_item(view["Id"], index, view["CollectionType"]) for index in range(items)]
+            for view in self.views
+        }
+        self.port = None
+        self.sockets = set()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def host(self):
+        return "127.0.0.1"
+
+    def _send(self, request, payload):
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.etag:
+            etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            headers["ETag"] = etag
+        self.bytes_sent += len(body)
+        return web.Response(body=body, headers=headers)
+
+    async def _views(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return self._send(request, {"Items": self.views})
+
+    async def _latest(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        items = self.items.get(request.query.get("ParentId"))
+        if items is None:
+            return web.Response(status=404)
+        return self._send(request, items[: int(request.query.get("Limit", 20))])
+
+    async def _items(self, request):
+        """Recursive Items query by type, newest first; 400 when items_query is off, like older servers."""
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if not self.items_query:
+            return web.Response(status=400)
+        types = request.query.get("IncludeItemTypes", "").split(",")
+        items = sorted(
+            (item for library in self.items.values() for item in library if item["Type"] in types),
+            key=lambda item: item["DateCreated"],
+            reverse=True,
+        )
+        limit = int(request.query.get("Limit", 20))
+        return self._send(request, {"Items": items[:limit], "TotalRecordCount": len(items)})
+
+    async def _image(self, request):
+        """Placeholder bytes standing for a JPEG, smaller at lower quality."""
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        body = b"\xff\xd8" + b"\0" * 100 * int(request.query.get("quality", 90)) + b"\xff\xd9"
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="image/jpeg")
+
+    async def _ancestors(self, request):
+        self.requests += 1
+        item = request.match_info["item_id"]
+        for library, items in self.items.items():
+            if any(entry["Id"] == item for entry in items):
+                return self._send(request, [{"Id": library, "Type": "CollectionFolder"}])
+        return web.Response(status=404)
+
+    async def _websocket(self, request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets.add(socket)
+        try:
+            async for _message in socket:
+                pass
+        finally:
+            self.sockets.discard(socket)
+        return socket
+
+    async def _broadcast(self, message):
+        for socket in list(self.sockets):
+            await socket.send_json(message)
+
+    def add_item(self, library):
+        """Add a new item at the top of a library and push its LibraryChanged event."""
+        view = next(view for view in self.views if view["Id"] == library)
+        item = make_item(library, len(self.items[library]), view["CollectionType"])
+        item["DateCreated"] = "2030-01-01T00:00:00.0000000Z"
+        self.items[library].insert(0, item)
+        self.library_changed(ItemsAdded=[item["Id"]])
+        return item
+
+    def library_changed(self, **data):
+        """Push a LibraryChanged event with data to all connected clients."""
+        message = {"MessageType": "LibraryChanged", "Data": data}
+        asyncio.run_coroutine_threadsafe(self._broadcast(message), self._loop).result()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/Users/{user_id}/Views", self._views)
+        app.router.add_get("/Users/{user_id}/Items/Latest", self._latest)
+        app.router.add_get("/Users/{user_id}/Items", self._items)
+        app.router.add_get("/Items/{item_id}/Ancestors", self._ancestors)
+        app.router.add_get("/Items/{item_id}/Images/{image_type}", self._image)
+        app.router.add_get("/embywebsocket", self._websocket)
+        return app
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        """Start serving and return once the port is known."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake_emby", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    async def _stop(self):
+        for socket in list(self.sockets):
+            await socket.close()
+        await self._runner.cleanup()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,171 @@
+"""Local copies of the card artwork.
+
+Posters and fanart of the current items are downloaded in the background,
+resized and recompressed by Emby, into the www folder of Home Assistant and
+handed to the card as /local URLs. The folder is bounded in bytes, least
+recently shown images first out.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+_LOGGER = logging.getLogger(__name__)
+
+TIMEOUT = 10
+FOLDER = "emby_upcoming_media"
+URL_PREFIX = "/local/" + FOLDER + "/"
+
+# Card keys holding an image URL
+IMAGE_KEYS = ("poster", "fanart")
+
+
+class ArtworkCache:
+    """Disk LRU of downloaded artwork, shared by all clients."""
+
+    def __init__(self, directory, max_bytes, quality):
+        """Init."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.evictions = 0
+        self._files = OrderedDict()
+        self._pending = set()
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_name(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".jpg"
+
+    def load(self):
+        """Index the images already on disk, oldest first."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            for _mtime, name, size in sorted(files):
+                self._files[name] = size
+        self._evict()
+
+    def local_url(self, url):
+        """Return the /local URL of a downloaded image, or None."""
+        name = self.file_name(url)
+        with self._lock:
+            if name not in self._files:
+                self.misses += 1
+                return None
+            self._files.move_to_end(name)
+            self.hits += 1
+        return URL_PREFIX + name
+
+    def localize(self, card_item):
+        """Return the card item with its downloaded images served locally, and the missing image URLs."""
+        missing = []
+        for key in IMAGE_KEYS:
+            url = card_item.get(key)
+            if not isinstance(url, str):
+                # Missing, or [id, type] for the image URL template
+                continue
+            local = self.local_url(url)
+            if local is None:
+                missing.append(url)
+            else:
+                card_item = {**card_item, key: local}
+        return card_item, missing
+
+    def claim(self, urls):
+        """Return the urls not being downloaded already, marking them as being downloaded."""
+        with self._lock:
+            urls = [url for url in dict.fromkeys(urls) if url not in self._pending]
+            self._pending.update(urls)
+        return urls
+
+    def fetch_url(self, url):
+        """The image URL with the quality of the cached copies."""
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query["quality"] = str(self.quality)
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def prefetch(self, urls):
+        """Download the claimed images, returning how many were added."""
+        added = 0
+        try:
+            for url in urls:
+                if self._download(url):
+                    added += 1
+        finally:
+            with self._lock:
+                self._pending.difference_update(urls)
+        if added:
+            self._evict()
+        return added
+
+    def _download(self, url):
+        try:
+            response = self._session.get(self.fetch_url(url), timeout=TIMEOUT)
+        except OSError as err:
+            _LOGGER.debug("Could not download %s: %s", url, err)
+            return False
+        if response.status_code != 200 or not response.content:
+            _LOGGER.debug("Could not download %s: %s", url, response.status_code)
+            return False
+
+        name = self.file_name(url)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".artwork.")
+            with os.fdopen(fd, "wb") as file:
+                file.write(response.content)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except OSError as err:
+            _LOGGER.warning("Could not write artwork %s: %s", name, err)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        with self._lock:
+            self._files[name] = len(response.content)
+            self.downloads += 1
+        return True
+
+    def _evict(self):
+        """Delete the least recently shown images beyond max_bytes."""
+        with self._lock:
+            evicted = []
+            total = sum(self._files.values())
+            while total > self.max_bytes and len(self._files) > 1:
+                name, size = self._files.popitem(last=False)
+                total -= size
+                evicted.append(name)
+            self.evictions += len(evicted)
+
+        for name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": sum(self._files.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "downloads": self.downloads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,95 @@
+"""Circuit breaker of the requests to one server."""
+import threading
+import time
+from datetime import datetime, timezone
+
+# Consecutive failed requests opening the circuit
+THRESHOLD = 3
+PROBE_MIN = 30
+PROBE_MAX = 900
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops asking a server that does not answer, probing it with backoff.
+
+    After THRESHOLD requests in a row failed the circuit opens, and the
+    requests are answered with the last data without waiting for a timeout.
+    Once the probe delay is over one request goes through: if it succeeds the
+    circuit closes, if it fails the delay doubles, up to PROBE_MAX.
+    """
+
+    def __init__(self, threshold=THRESHOLD, probe_min=PROBE_MIN, probe_max=PROBE_MAX):
+        """Init."""
+        self.threshold = threshold
+        self.probe_min = probe_min
+        self.probe_max = probe_max
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = probe_min
+        self.next_probe = 0.0
+        self.opened = None
+        self.short_circuits = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        """Whether requests go to the server, False while they are answered with the last data."""
+        return self.state == CLOSED
+
+    def allow(self):
+        """Return whether a request may go to the server, counting those that may not."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.time()
+            if now >= self.next_probe:
+                # One probe per delay, another one goes through if it never reports back
+                self.state = HALF_OPEN
+                self.next_probe = now + self.delay
+                return True
+            self.short_circuits += 1
+            return False
+
+    def succeeded(self):
+        """Close the circuit, return whether it was open."""
+        with self._lock:
+            was_open = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self.delay = self.probe_min
+            self.opened = None
+            return was_open
+
+    def failed(self):
+        """Count a failed request, return whether it opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.delay = min(self.delay * 2, self.probe_max)
+            elif self.state == OPEN or self.failures < self.threshold:
+                return False
+            opened = self.state == CLOSED
+            self.state = OPEN
+            self.next_probe = time.time() + self.delay
+            if opened:
+                self.opened = datetime.now(timezone.utc)
+            return opened
+
+    def next_probe_in(self):
+        """Return the seconds until the next probe, None while closed."""
+        if self.state == CLOSED:
+            return None
+        return max(0, round(self.next_probe - time.time()))
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened.isoformat() if self.opened else None,
+            "next_probe_in": self.next_probe_in(),
+            "short_circuits": self.short_circuits,
+        }
@@ -0,0 +1,219 @@
+"""Caches."""
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class CardCache:
+    """Bounded LRU cache of built card items, shared by the sensors of a client."""
+
+    def __init__(self, max_size):
+        """Init."""
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached card item for key, or None."""
+        with self._lock:
+            card_item = self._items.get(key)
+            if card_item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return card_item
+
+    def put(self, key, card_item):
+        """Store a card item, evicting the least recently used ones."""
+        with self._lock:
+            self._items[key] = card_item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        """Return the cache size and hit/miss counters."""
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ResponseCache:
+    """Last response per URL, with its validators and a digest of its body."""
+
+    def __init__(self):
+        """Init."""
+        self.refreshes = 0
+        self.not_modified = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def headers(self, url):
+        """Return the conditional request headers for url."""
+        entry = self._entries.get(url)
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def unchanged(self, url):
+        """Return the cached result after a 304 Not Modified, or None."""
+        entry = self._entries.get(url)
+        with self._lock:
+            self.refreshes += 1
+            if entry is not None:
+                self.not_modified += 1
+        return entry["result"] if entry is not None else None
+
+    def store(self, url, headers, body, parse):
+        """Return the parsed body, reusing the cached result if the body did not change."""
+        digest = hashlib.sha1(body).digest()
+        entry = self._entries.get(url)
+        if entry is not None and entry["digest"] == digest:
+            result = entry["result"]
+            with self._lock:
+                self.refreshes += 1
+                self.not_modified += 1
+        else:
+            result = parse(body)
+            with self._lock:
+                self.refreshes += 1
+
+        self._entries[url] = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "digest": digest,
+            "result": result,
+        }
+        return result
+
+    def forget(self, result):
+        """Drop the responses that decoded to result."""
+        for url in [url for url, entry in list(self._entries.items()) if entry["result"] is result]:
+            self._entries.pop(url, None)
+
+    def stats(self):
+        """Return the number of refreshes and how many of them were no-ops."""
+        return {
+            "entries": len(self._entries),
+            "refreshes": self.refreshes,
+            "not_modified": self.not_modified,
+        }
+
+
+def estimate_size(value):
+    """Rough size in bytes of a decoded response, shared strings counted each time."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, element in value.items():
+            size += sys.getsizeof(key) + estimate_size(element)
+    elif isinstance(value, (list, tuple)):
+        for element in value:
+            size += estimate_size(element)
+    elif hasattr(value, "__slots__"):
+        for field in value.__slots__:
+            element = getattr(value, field, None)
+            if element is not None:
+                size += estimate_size(element)
+    return size
+
+
+class DataStore(MutableMapping):
+    """The last data of each library, bounded by entry count and age.
+
+    Entries older than max_age seconds are dropped on access, the least
+    recently written ones once there are more than max_entries. Pinned keys
+    are never evicted. Referenced keys, a set kept up to date by the owner,
+    only leave with age: the count bound drops the other entries, and may be
+    exceeded when the sensors read more keys than that. on_evict is called
+    with the key and value of each dropped entry.
+    """
+
+    def __init__(self, max_entries, max_age, pinned=(), referenced=(), on_evict=None):
+        """Init."""
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.pinned = frozenset(pinned)
+        self.referenced = referenced
+        self.evictions = 0
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _evict(self, key):
+        value = self._entries.pop(key)[0]
+        self.evictions += 1
+        if self._on_evict is not None:
+            self._on_evict(key, value)
+
+    def _expire(self):
+        oldest = time.monotonic() - self.max_age
+        for key, (_value, written, _size) in list(self._entries.items()):
+            if written < oldest and key not in self.pinned:
+                self._evict(key)
+
+    def __getitem__(self, key):
+        with self._lock:
+            value, written, _size = self._entries[key]
+            if key not in self.pinned and written < time.monotonic() - self.max_age:
+                self._evict(key)
+                raise KeyError(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), estimate_size(value))
+            self._entries.move_to_end(key)
+            unpinned = [entry for entry in self._entries if entry not in self.pinned]
+            evictable = [entry for entry in unpinned if entry not in self.referenced]
+            for entry in evictable[: max(0, len(unpinned) - self.max_entries)]:
+                self._evict(entry)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._entries[key]
+
+    def __iter__(self):
+        with self._lock:
+            self._expire()
+            return iter(list(self._entries))
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def copy(self):
+        """Return the entries as a dict, consistent while other threads write or evict."""
+        with self._lock:
+            self._expire()
+            return {key: value for key, (value, _written, _size) in self._entries.items()}
+
+    def retain(self, keys):
+        """Drop the entries of the keys not in keys, except pinned ones."""
+        with self._lock:
+            for key in [key for key in self._entries if key not in keys and key not in self.pinned]:
+                self._evict(key)
+
+    def stats(self):
+        """Return the entry count, estimated bytes and evictions."""
+        with self._lock:
+            self._expire()
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(size for _value, _written, size in self._entries.values()),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+            }
@@ -1,13 +1,42 @@
 """Client."""
+import asyncio
 import datetime
+import json
 import requests
 import logging
+import threading
+import time
+import aiohttp
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .breaker import CircuitBreaker
+from .cache import CardCache, DataStore, ResponseCache
+from .dates import CREATED, normalize_dates
+from .model import compact_items
+from .scheduler import PollScheduler
+from .stats import Diagnostics
 
 _LOGGER = logging.getLogger(__name__)
 
+RETRY_STATUSES = (500, 502, 503, 504)
+BACKOFF_FACTOR = 0.5
+TIMEOUT = 10
+SNAPSHOT_VERSION = 2
+DEFAULT_FIELDS = "CommunityRating,Studios,PremiereDate,Genres,ChildCount,ProductionYear,DateCreated,Overview,RemoteTrailers,Path"
 
-class EmbyClient:
-    """Client class"""
+# Statuses of a server that does not support the grouped Items query
+UNSUPPORTED_STATUSES = (400, 404, 501)
+
+
+def group_key(categoryIds):
+    """Key of the data of grouped libraries fetched by one query."""
+    return ",".join(sorted(categoryIds))
+
+
+class EmbyClientBase:
+    """Settings, URLs and response handling shared by the sync and async clients."""
 
     def __init__(
         self,
@@ -19,9 +48,21 @@ class EmbyClient:
         user_id,
         show_episodes,
         suppress_connection_errors,
+        card_cache_size=500,
+        max_concurrency=4,
+        request_ttl=10,
+        min_interval=300,
+        max_interval=14400,
+        max_entries=50,
+        max_age=604800,
+        breaker=None,
     ):
         """Init."""
-        self.data = {}
+        # Data keys read by the sensors of all platform entries of the client
+        self.referenced_keys = set()
+        self.data = DataStore(
+            max_entries, max_age, pinned=("ViewCategories",), referenced=self.referenced_keys, on_evict=self._forget
+        )
         self.host = host
         self.ssl = "s" if ssl else ""
         self.port = port
@@ -30,63 +71,470 @@ class EmbyClient:
         self.max_items = max_items
         self.show_episodes = "&GroupItems=False" if show_episodes else ""
         self.suppress_connection_errors = suppress_connection_errors
+        self.card_cache = CardCache(card_cache_size)
+        self.max_concurrency = max_concurrency
+        self.request_ttl = request_ttl
+        self.response_cache = ResponseCache()
+        self.diagnostics = Diagnostics()
+        self.scheduler = PollScheduler(min_interval, max_interval)
+        # Shared by the clients of all users of the server
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        # Called when the data to keep in the snapshot changed
+        self.snapshot_listener = None
+        self.item_libraries = {}
+        self.group_query = True
+        self.push = None
+        self._recent = {}
+        self._inflight = {}
+
+    def get_view_categories_url(self):
+        return "http{0}://{1}:{2}/Users/{3}/Views?api_key={4}".format(
+            self.ssl, self.host, self.port, self.user_id, self.api_key
+        )
+
+    def get_data_url(self, categoryId, fields=DEFAULT_FIELDS):
+        return "http{0}://{1}:{2}/Users/{3}/Items/Latest?Limit={4}&Fields={5}&EnableImageTypes=Primary,Backdrop&ImageTypeLimit=1&EnableUserData=false&ParentId={6}&api_key={7}{8}".format(
+            self.ssl,
+            self.host,
+            self.port,
+            self.user_id,
+            self.max_items,
+            fields,
+            categoryId,
+            self.api_key,
+            self.show_episodes,
+        )
+
+    def get_group_url(self, itemTypes, fields=DEFAULT_FIELDS):
+        """Newest items of the given types across all libraries, sorted and truncated by Emby.
+
+        Like Latest, played items and missing episodes are left out.
+        """
+        return "http{0}://{1}:{2}/Users/{3}/Items?Recursive=true&IncludeItemTypes={4}&IsPlayed=false&IsMissing=false&SortBy=DateCreated&SortOrder=Descending&Limit={5}&Fields={6}&EnableImageTypes=Primary,Backdrop&ImageTypeLimit=1&EnableUserData=false&api_key={7}".format(
+            self.ssl,
+            self.host,
+            self.port,
+            self.user_id,
+            itemTypes,
+            self.max_items,
+            fields,
+            self.api_key,
+        )
+
+    def get_ancestors_url(self, itemId):
+        return "http{0}://{1}:{2}/Items/{3}/Ancestors?UserId={4}&api_key={5}".format(
+            self.ssl, self.host, self.port, itemId, self.user_id, self.api_key
+        )
+
+    def get_websocket_url(self):
+        return "ws{0}://{1}:{2}/embywebsocket?api_key={3}&deviceId=emby_upcoming_media".format(
+            self.ssl, self.host, self.port, self.api_key
+        )
+
+    def get_base_url(self):
+        return "http{0}://{1}:{2}".format(self.ssl, self.host, self.port)
+
+    def get_image_url_template(self):
+        """Image URL with the item id and image type left as {0} and {1}."""
+        return self.get_base_url() + "/Items/{0}/Images/{1}?maxHeight=360&maxWidth=640&quality=90"
+
+    def get_image_url(self, itemId, imageType):
+        return self.get_image_url_template().format(itemId, imageType)
+
+    def _host_unavailable(self):
+        if not self.suppress_connection_errors:
+            _LOGGER.warning("Host %s is not available", self.host)
+        self._state = "%s cannot be reached" % self.host
+
+    def _url_unavailable(self, url):
+        _LOGGER.info("Could not reach url %s", url)
+        self._state = "%s cannot be reached" % self.host
+
+    def _server_failed(self):
+        if self.breaker.failed():
+            _LOGGER.warning(
+                "%s failed %d requests in a row, using the last data until the next try in %d s",
+                self.host,
+                self.breaker.failures,
+                self.breaker.next_probe_in(),
+            )
+
+    def _server_answered(self, status):
+        if status in RETRY_STATUSES:
+            self._server_failed()
+        elif self.breaker.succeeded():
+            _LOGGER.info("%s is reachable again", self.host)
+
+    def _short_circuit(self, key):
+        """The last data of key, while requests to the server are paused by the circuit breaker."""
+        _LOGGER.debug("Not asking %s for %s, next try in %d s", self.host, key, self.breaker.next_probe_in())
+        self.diagnostics.add_short_circuit(key)
+        return self.data.get(key)
+
+    def _set_view_categories(self, result):
+        changed = self.data.get("ViewCategories") != result["Items"]
+        self.data["ViewCategories"] = result["Items"]
+        if changed:
+            self._snapshot_changed()
+        return self.data["ViewCategories"]
+
+    def _set_data(self, categoryId, result, libraries=None):
+        """Store the items of a library, or of the grouped libraries of one query."""
+        self._state = "Online"
+        previous = self.data.get(categoryId)
+        if previous is not None and previous is not result:
+            self._forget_items(categoryId, previous)
+        self.data[categoryId] = result
+        if previous is not result:
+            # After the store, the snapshot may be built on the event loop right away
+            self._snapshot_changed()
+        if libraries is None:
+            # The library of each item of a grouped query is not known, push events look it up
+            for item in result:
+                self.item_libraries[item.get("Id")] = categoryId
+        # A grouped query has its own schedule, it does not refresh the data of its libraries
+        self.scheduler.observe(categoryId, max((item[CREATED] for item in result), default=None))
+        return self.data[categoryId]
+
+    def _forget_items(self, categoryId, items):
+        for item in items:
+            if self.item_libraries.get(item.get("Id")) == categoryId:
+                del self.item_libraries[item.get("Id")]
+
+    def _forget(self, categoryId, result):
+        """Free what refers to the data of a library evicted from the store."""
+        _LOGGER.debug("Evicting data of %s", categoryId)
+        self._forget_items(categoryId, result)
+        self.response_cache.forget(result)
+        for key in [key for key, entry in list(self._recent.items()) if entry[1] is result]:
+            self._recent.pop(key, None)
+        if categoryId in self.referenced_keys:
+            # Dropped by age, the sensors reading it fetch it again on their next update
+            self.scheduler.expedite([categoryId])
+
+    def libraries_changed(self, libraries):
+        """Fetch libraries, and the grouped queries of any of them, on their next update, without reusing a recent response."""
+        libraries = set(libraries)
+        self.scheduler.expedite(
+            [key for key in list(self.scheduler.libraries) if not libraries.isdisjoint(key.split(","))]
+        )
+        self._recent.clear()
+
+    def _library_failed(self, categoryId):
+        self.diagnostics.add_error(categoryId)
+        self.scheduler.failed(categoryId)
+
+    def _snapshot_changed(self):
+        if self.snapshot_listener is not None:
+            self.snapshot_listener()
+
+    def load_snapshot(self, snapshot):
+        """Restore the last good data of a snapshot, return whether there was any."""
+        if not isinstance(snapshot, dict) or not snapshot:
+            return False
+
+        self.data.update(
+            {key: value if key == "ViewCategories" else compact_items(value) for key, value in snapshot.items()}
+        )
+        return True
+
+    def snapshot(self):
+        """Return the last good data as JSON types, for the snapshot store."""
+        return {
+            key: value if key == "ViewCategories" else [item.to_dict() for item in value]
+            for key, value in self.data.copy().items()
+        }
+
+    def _parse_data(self, categoryId, body):
+        with self.diagnostics.span("decode", categoryId):
+            items = json.loads(body)
+            if isinstance(items, dict):
+                # Items query, Latest is a bare list
+                items = items.get("Items", [])
+            return compact_items(normalize_dates(items[: self.max_items]))
+
+    def _handle_data_response(self, categoryId, url, status, headers, body, libraries=None):
+        """Decode a Latest or Items response, or reuse the cached result if it did not change."""
+        if libraries is not None and status in UNSUPPORTED_STATUSES:
+            _LOGGER.info("Grouped Items query not supported by %s, fetching libraries one by one", self.host)
+            self.group_query = False
+            return
+
+        if status == 304:
+            result = self.response_cache.unchanged(url)
+        elif status == 200:
+            self.diagnostics.add_bytes(categoryId, len(body))
+            result = self.response_cache.store(
+                url, headers, body, lambda body: self._parse_data(categoryId, body)
+            )
+        else:
+            result = None
+
+        if result is None:
+            self._library_failed(categoryId)
+            self._url_unavailable(url)
+            return
+
+        _LOGGER.debug("Response cache: %s", self.response_cache.stats())
+        return self._set_data(categoryId, result, libraries)
+
+    def _recent_result(self, key):
+        """Return a result fetched less than request_ttl seconds ago, or None."""
+        entry = self._recent.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.request_ttl:
+            return entry[1]
+        return None
+
+    def _remember(self, key, result):
+        if result is not None:
+            self._recent[key] = (time.monotonic(), result)
+
+    def _successful_results(self, categoryIds, results):
+        """Drop the libraries that could not be fetched."""
+        successful = []
+        for categoryId, result in zip(categoryIds, results):
+            if result is None:
+                _LOGGER.warning("Skipping library %s, its items could not be fetched", categoryId)
+            else:
+                successful.append(result)
+        return successful
+
+
+class EmbyClient(EmbyClientBase):
+    """Client class"""
+
+    def __init__(self, *args, pool_size=10, retries=0, **kwargs):
+        """Init."""
+        super().__init__(*args, **kwargs)
+        self.session = self._create_session(pool_size, retries)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="emby_upcoming_media"
+        )
+        self._inflight_lock = threading.Lock()
+
+    @staticmethod
+    def _create_session(pool_size, retries):
+        """Create the keep-alive session shared by all API calls."""
+        retry = Retry(
+            total=retries,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self, event=None):
+        """Close the pooled connections, when Home Assistant stops."""
+        self._executor.shutdown(wait=False)
+        self.session.close()
 
     def get_view_categories(self):
         """This will pull the list of all View Categories on Emby"""
+        if not self.breaker.allow():
+            return self._short_circuit("ViewCategories") or []
+
         try:
-            url = "http{0}://{1}:{2}/Users/{3}/Views?api_key={4}".format(
-                self.ssl, self.host, self.port, self.user_id, self.api_key
-            )
+            url = self.get_view_categories_url()
             _LOGGER.info("Making API call on URL %s", url)
-            api = requests.get(url, timeout=10)
+            with self.diagnostics.span("view_categories"):
+                api = self.session.get(url, timeout=TIMEOUT)
         except OSError:
-            if not self.suppress_connection_errors:
-                _LOGGER.warning("Host %s is not available", self.host)
-            self._state = "%s cannot be reached" % self.host
+            self.diagnostics.add_error("ViewCategories")
+            self._server_failed()
+            self._host_unavailable()
             return []
 
+        self._server_answered(api.status_code)
         if api.status_code == 200:
-            self.data["ViewCategories"] = api.json()["Items"]
-            return self.data["ViewCategories"]
+            return self._set_view_categories(api.json())
 
-        _LOGGER.info("Could not reach url %s", url)
-        self._state = "%s cannot be reached" % self.host
+        self._url_unavailable(url)
         return []
 
-    def get_data(self, categoryId):
+    def _single_flight(self, key, fetch):
+        """Share one fetch between all callers asking for the same key."""
+        with self._inflight_lock:
+            result = self._recent_result(key)
+            if result is not None:
+                return result
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = fetch()
+            self._remember(key, result)
+            future.set_result(result)
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+        return result
+
+    def get_data(self, categoryId, fields=DEFAULT_FIELDS):
+        url = self.get_data_url(categoryId, fields)
+        return self._single_flight(url, lambda: self._fetch_data(categoryId, url))
+
+    def get_group_data(self, categoryIds, itemTypes, fields=DEFAULT_FIELDS):
+        """Fetch the newest items of grouped libraries with one query, None if it failed."""
+        url = self.get_group_url(itemTypes, fields)
+        return self._single_flight(url, lambda: self._fetch_data(group_key(categoryIds), url, categoryIds))
+
+    def _fetch_data(self, categoryId, url, libraries=None):
+        if not self.breaker.allow():
+            return self._short_circuit(categoryId)
+
         try:
-            url = "http{0}://{1}:{2}/Users/{3}/Items/Latest?Limit={4}&Fields=CommunityRating,Studios,PremiereDate,Genres,ChildCount,ProductionYear,DateCreated,Overview,RemoteTrailers,Path&ParentId={5}&api_key={6}{7}".format(
-                self.ssl,
-                self.host,
-                self.port,
-                self.user_id,
-                self.max_items,
-                categoryId,
-                self.api_key,
-                self.show_episodes,
-            )
             _LOGGER.info("Making API call on URL %s", url)
-            api = requests.get(url, timeout=10)
+            with self.diagnostics.span("network", categoryId):
+                api = self.session.get(
+                    url, headers=self.response_cache.headers(url), timeout=TIMEOUT
+                )
         except OSError:
-            if not self.suppress_connection_errors:
-                _LOGGER.warning("Host %s is not available", self.host)
-            self._state = "%s cannot be reached" % self.host
+            self._library_failed(categoryId)
+            self._server_failed()
+            self._host_unavailable()
             return
 
-        if api.status_code == 200:
-            self._state = "Online"
-            self.data[categoryId] = api.json()[: self.max_items]
+        self._server_answered(api.status_code)
+        return self._handle_data_response(
+            categoryId, url, api.status_code, api.headers, api.content, libraries
+        )
 
+    def get_data_many(self, categoryIds, fields=DEFAULT_FIELDS):
+        """Fetch several libraries concurrently, skipping the failed ones."""
+        if len(categoryIds) == 1:
+            results = [self.get_data(categoryIds[0], fields)]
         else:
-            _LOGGER.info("Could not reach url %s", url)
-            self._state = "%s cannot be reached" % self.host
-            return
+            results = list(
+                self._executor.map(lambda categoryId: self.get_data(categoryId, fields), categoryIds)
+            )
 
-        return self.data[categoryId]
+        return self._successful_results(categoryIds, results)
 
-    def get_image_url(self, itemId, imageType):
-        url = "http{0}://{1}:{2}/Items/{3}/Images/{4}?maxHeight=360&maxWidth=640&quality=90".format(
-            self.ssl, self.host, self.port, itemId, imageType
+
+class AsyncEmbyClient(EmbyClientBase):
+    """Client class running on the event loop with a shared aiohttp session."""
+
+    def __init__(self, session, *args, retries=0, **kwargs):
+        """Init."""
+        super().__init__(*args, **kwargs)
+        self.session = session
+        self.retries = retries
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _async_get(self, url, headers=None):
+        """Return the status, headers and body of a GET, retrying with backoff."""
+        _LOGGER.info("Making API call on URL %s", url)
+        timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+        attempt = 0
+        while True:
+            try:
+                async with self.session.get(url, headers=headers, timeout=timeout) as api:
+                    if api.status in RETRY_STATUSES and attempt < self.retries:
+                        raise aiohttp.ClientResponseError(
+                            api.request_info, api.history, status=api.status
+                        )
+                    if api.status != 200:
+                        return api.status, api.headers, b""
+                    return api.status, api.headers, await api.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                if attempt >= self.retries:
+                    raise
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+            attempt += 1
+
+    async def async_get_view_categories(self):
+        """This will pull the list of all View Categories on Emby"""
+        if not self.breaker.allow():
+            return self._short_circuit("ViewCategories") or []
+
+        url = self.get_view_categories_url()
+        try:
+            with self.diagnostics.span("view_categories"):
+                status, headers, body = await self._async_get(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            self.diagnostics.add_error("ViewCategories")
+            self._server_failed()
+            self._host_unavailable()
+            return []
+
+        self._server_answered(status)
+        if status == 200:
+            return self._set_view_categories(json.loads(body))
+
+        self._url_unavailable(url)
+        return []
+
+    async def _async_single_flight(self, key, fetch):
+        """Share one fetch between all callers asking for the same key."""
+        result = self._recent_result(key)
+        if result is not None:
+            return result
+
+        task = self._inflight.get(key)
+        if task is None:
+
+            async def fetch_and_remember():
+                result = await fetch()
+                self._remember(key, result)
+                return result
+
+            task = self._inflight[key] = asyncio.ensure_future(fetch_and_remember())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shielded so a cancelled caller does not cancel the fetch of the others
+        return await asyncio.shield(task)
+
+    async def async_get_data(self, categoryId, fields=DEFAULT_FIELDS):
+        url = self.get_data_url(categoryId, fields)
+        return await self._async_single_flight(url, lambda: self._async_fetch_data(categoryId, url))
+
+    async def async_get_group_data(self, categoryIds, itemTypes, fields=DEFAULT_FIELDS):
+        """Fetch the newest items of grouped libraries with one query, None if it failed."""
+        url = self.get_group_url(itemTypes, fields)
+        return await self._async_single_flight(
+            url, lambda: self._async_fetch_data(group_key(categoryIds), url, categoryIds)
         )
-        return url
-            
+
+    async def _async_fetch_data(self, categoryId, url, libraries=None):
+        if not self.breaker.allow():
+            return self._short_circuit(categoryId)
+
+        try:
+            with self.diagnostics.span("network", categoryId):
+                status, headers, body = await self._async_get(
+                    url, self.response_cache.headers(url)
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            self._library_failed(categoryId)
+            self._server_failed()
+            self._host_unavailable()
+            return
+
+        self._server_answered(status)
+        return self._handle_data_response(categoryId, url, status, headers, body, libraries)
+
+    async def async_get_data_many(self, categoryIds, fields=DEFAULT_FIELDS):
+        """Fetch several libraries concurrently, skipping the failed ones."""
+
+        async def fetch(categoryId):
+            async with self._semaphore:
+                return await self.async_get_data(categoryId, fields)
+
+        results = await asyncio.gather(*(fetch(categoryId) for categoryId in categoryIds))
+        return self._successful_results(categoryIds, results)
@@ -0,0 +1,50 @@
+"""Dates."""
+from datetime import datetime, timezone
+
+import dateutil.parser
+
+# Keys added to every item when it is ingested
+RELEASE = "_release"
+AIRDATE = "_airdate"
+CREATED = "_created"
+
+
+def parse_datetime(value):
+    """Parse an Emby timestamp; dateutil only handles what fromisoformat rejects."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        parsed = dateutil.parser.isoparse(value)
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_year(value):
+    """Return the year of an Emby timestamp, read straight from "YYYY-..." when possible."""
+    if len(value) >= 5 and value[4] == "-" and value[:4].isdigit():
+        return int(value[:4])
+    return parse_datetime(value).year
+
+
+def normalize_dates(items):
+    """Precompute the release year, airdate and sort key of freshly fetched items."""
+    now = datetime.now().isoformat()
+    for item in items:
+        if RELEASE in item:
+            continue
+
+        premiere = item.get("PremiereDate")
+        try:
+            item[RELEASE] = str(parse_year(premiere)) if premiere else None
+        except ValueError:
+            item[RELEASE] = None
+        item[AIRDATE] = premiere or now
+
+        try:
+            item[CREATED] = parse_datetime(item["DateCreated"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            item[CREATED] = 0.0
+
+    return items
@@ -0,0 +1,362 @@
+"""Card formatting.
+
+A spec lists the card keys of a media type as (key, extractor factory, *args);
+CardFormatter compiles it once per client and card setting. Extractors read
+MediaItems, where studios and trailers are already reduced to their first name
+or URL.
+"""
+from datetime import datetime, timedelta
+
+from .dates import AIRDATE, RELEASE, parse_year
+
+SKIP = object()
+STAR = "\u2605"  # Star character
+ELLIPSIS = "\u2026"
+
+DEEP_LINK_PATH = "/web/index.html#!/details?id={0}"
+
+# Optional fields that have to be requested from Emby to be part of an item
+EMBY_FIELDS = (
+    "CommunityRating",
+    "Studios",
+    "PremiereDate",
+    "Genres",
+    "ChildCount",
+    "ProductionYear",
+    "DateCreated",
+    "Overview",
+    "RemoteTrailers",
+)
+
+
+def reads(*fields):
+    """Declare the optional Emby fields read by an extractor factory."""
+
+    def decorator(factory):
+        factory.reads = fields
+        return factory
+
+    return decorator
+
+
+def first_of(formatter, *fields):
+    def extract(show):
+        for field in fields:
+            if field in show:
+                return show[field]
+        return ""
+
+    return extract
+
+
+def value(formatter, field, default=SKIP):
+    return lambda show: show.get(field, default)
+
+
+def item_id(formatter):
+    return lambda show: show.get("Id", "")
+
+
+def join(formatter, field, skip_empty=False):
+    def extract(show):
+        values = show.get(field)
+        if values is None or (skip_empty and len(values) == 0):
+            return SKIP
+        return ", ".join(values[:3])
+
+    return extract
+
+
+def first(formatter, field):
+    def extract(show):
+        values = show.get(field)
+        if not values:
+            return SKIP
+        return values[0]
+
+    return extract
+
+
+@reads("PremiereDate")
+def airdate(formatter):
+    def extract(show):
+        if AIRDATE in show:
+            return show[AIRDATE]
+        return show.get("PremiereDate") or datetime.now().isoformat()
+
+    return extract
+
+
+@reads("PremiereDate")
+def release(formatter, missing=SKIP):
+    def extract(show):
+        if RELEASE in show:
+            year = show[RELEASE]
+        elif "PremiereDate" in show:
+            year = str(parse_year(show["PremiereDate"]))
+        else:
+            year = None
+        return missing if year is None else year
+
+    return extract
+
+
+@reads("ProductionYear")
+def production_year(formatter):
+    return lambda show: str(show.get("ProductionYear", ""))
+
+
+def runtime(formatter):
+    def extract(show):
+        if "RunTimeTicks" not in show:
+            return ""
+        return timedelta(microseconds=show["RunTimeTicks"] / 10).total_seconds() / 60
+
+    return extract
+
+
+def _episode_number(show):
+    if "ParentIndexNumber" in show and "IndexNumber" in show:
+        return "S{:02d}E{:02d}".format(show["ParentIndexNumber"], show["IndexNumber"])
+    return None
+
+
+def episode_number(formatter):
+    def extract(show):
+        number = _episode_number(show)
+        if number is not None:
+            return number
+        if "ParentIndexNumber" in show:
+            return "Season {:d} Special".format(show["ParentIndexNumber"])
+        return SKIP
+
+    return extract
+
+
+@reads("ChildCount")
+def seasons(formatter):
+    def extract(show):
+        number = _episode_number(show)
+        if number is not None:
+            return number
+        if "ChildCount" not in show:
+            return SKIP
+        if show["ChildCount"] > 1:
+            return "{0} seasons".format(show["ChildCount"])
+        return "{0} season".format(show["ChildCount"])
+
+    return extract
+
+
+@reads("ProductionYear")
+def number_or_year(formatter):
+    def extract(show):
+        number = _episode_number(show)
+        if number is not None:
+            return number
+        return show.get("ProductionYear", "")
+
+    return extract
+
+
+@reads("CommunityRating")
+def rating(formatter):
+    def extract(show):
+        if "CommunityRating" not in show:
+            return SKIP
+        return "{} {:.1f}".format(STAR, show["CommunityRating"])
+
+    return extract
+
+
+@reads("CommunityRating")
+def rating_text(formatter):
+    return lambda show: "%s %s" % (STAR, show.get("CommunityRating", ""))
+
+
+@reads("RemoteTrailers")
+def trailer(formatter):
+    def extract(show):
+        trailers = show.get("RemoteTrailers")
+        if not trailers:
+            return SKIP
+        return trailers[0]
+
+    return extract
+
+
+@reads("Overview")
+def summary(formatter):
+    """Overview, cut at a word boundary past summary_length characters if set."""
+    length = formatter.summary_length
+
+    def extract(show):
+        if "Overview" not in show:
+            return SKIP
+        text = show["Overview"]
+        if not length or text is None or len(text) <= length:
+            return text
+        return text[:length].rsplit(" ", 1)[0] + ELLIPSIS
+
+    return extract
+
+
+def image(formatter, image_type, id_field="Id"):
+    """Image URL; an image_type of "poster" follows the use_backdrop setting.
+
+    With URL templates, [item id, image type] for the "image" template.
+    """
+    if image_type == "poster":
+        image_type = formatter.poster_type
+    image_url = formatter.image_url
+
+    def extract(show):
+        if id_field not in show:
+            return SKIP
+        if image_url is None:
+            return [show[id_field], image_type]
+        return image_url.format(show[id_field], image_type)
+
+    return extract
+
+
+def deep_link(formatter):
+    """Deep link URL, or the item id for the "deep_link" template."""
+    if formatter.url_templates:
+        return lambda show: show.get("Id", "")
+    deep_link_url = formatter.base_url + DEEP_LINK_PATH
+    return lambda show: deep_link_url.format(show.get("Id", ""))
+
+
+def url_templates(client):
+    """The URL templates sent once per sensor instead of a URL per item."""
+    return {
+        "image": client.get_image_url_template(),
+        "deep_link": client.get_base_url() + DEEP_LINK_PATH,
+    }
+
+
+TV_EPISODE = (
+    ("title", first_of, "SeriesName", "Name"),
+    ("episode", value, "Name", ""),
+    ("airdate", airdate),
+    ("release", release, ""),
+    ("runtime", runtime),
+    ("number", episode_number),
+    ("summary", summary),
+    ("trailer", trailer),
+    ("poster", image, "poster", "ParentBackdropItemId"),
+    ("fanart", image, "Backdrop", "ParentBackdropItemId"),
+    ("deep_link", deep_link),
+    ("id", item_id),
+)
+
+TV_SHOW = (
+    ("title", first_of, "Name"),
+    ("airdate", airdate),
+    ("release", release),
+    ("number", seasons),
+    ("runtime", runtime),
+    ("genres", join, "Genres"),
+    ("rating", rating),
+    ("summary", summary),
+    ("trailer", trailer),
+    ("poster", image, "poster"),
+    ("fanart", image, "Backdrop"),
+    ("deep_link", deep_link),
+    ("id", item_id),
+)
+
+MOVIE = (
+    ("title", first_of, "Name"),
+    ("airdate", airdate),
+    ("release", release),
+    ("runtime", runtime),
+    ("genres", join, "Genres"),
+    ("studio", first, "Studios"),
+    ("rating", rating),
+    ("summary", summary),
+    ("trailer", trailer),
+    ("poster", image, "poster"),
+    ("fanart", image, "Backdrop"),
+    ("deep_link", deep_link),
+    ("id", item_id),
+)
+
+MUSIC = (
+    ("title", first_of, "Name"),
+    ("airdate", airdate),
+    ("studio", join, "Artists", True),
+    ("runtime", runtime),
+    ("genres", join, "Genres"),
+    ("release", production_year),
+    ("number", number_or_year),
+    ("rating", rating),
+    ("summary", summary),
+    ("poster", image, "Primary"),
+    ("fanart", image, "Backdrop"),
+    ("deep_link", deep_link),
+)
+
+OTHER = (
+    ("title", first_of, "Name"),
+    ("airdate", airdate),
+    ("episode", value, "OfficialRating", ""),
+    ("officialrating", value, "OfficialRating", ""),
+    ("genres", join, "Genres"),
+    ("runtime", runtime),
+    ("studio", join, "Artists", True),
+    ("number", number_or_year),
+    ("poster", image, "Primary"),
+    ("rating", rating_text),
+    ("summary", summary),
+    ("trailer", trailer),
+    ("fanart", image, "Backdrop"),
+    ("deep_link", deep_link),
+)
+
+CARD_SPECS = {
+    "tv_episode": TV_EPISODE,
+    "tv_show": TV_SHOW,
+    "movie": MOVIE,
+    "music": MUSIC,
+    "other": OTHER,
+}
+
+
+def spec_fields(spec):
+    """Return the optional Emby fields read by a spec, in request order."""
+    fields = set()
+    for _key, factory, *args in spec:
+        fields.update(getattr(factory, "reads", ()))
+        fields.update(arg for arg in args if arg in EMBY_FIELDS)
+
+    return [field for field in EMBY_FIELDS if field in fields]
+
+
+class CardFormatter:
+    """A spec compiled for one client and card setting."""
+
+    def __init__(self, spec, client, use_backdrop, summary_length=0, url_templates=False):
+        """Init."""
+        self.base_url = client.get_base_url()
+        self.image_url = None if url_templates else client.get_image_url_template()
+        self.poster_type = "Backdrop" if use_backdrop else "Primary"
+        self.summary_length = summary_length
+        self.url_templates = url_templates
+        self.extractors = tuple(
+            (key, factory(self, *args)) for key, factory, *args in spec
+        )
+
+    def format(self, show):
+        """Build the card item of one Emby item, leaving out malformed values."""
+        card_item = {}
+        for key, extract in self.extractors:
+            try:
+                card_value = extract(show)
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            if card_value is not SKIP:
+                card_item[key] = card_value
+
+        return card_item
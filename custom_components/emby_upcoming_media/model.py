@@ -0,0 +1,125 @@
+"""Compact media items.
+
+Only the fields read by the cards are kept from an Emby item. Repeated strings
+(types, genres, studios, artists) are interned so that the items of all
+libraries and sensors share them, and nested lists are cut down to the part
+the cards show.
+"""
+import sys
+
+from .dates import AIRDATE, CREATED, RELEASE
+
+FIELDS = (
+    "Id",
+    "Name",
+    "Type",
+    "SeriesName",
+    "DateCreated",
+    "Etag",
+    "PremiereDate",
+    "ProductionYear",
+    "RunTimeTicks",
+    "ParentIndexNumber",
+    "IndexNumber",
+    "ChildCount",
+    "CommunityRating",
+    "OfficialRating",
+    "Overview",
+    "ParentBackdropItemId",
+    "Genres",
+    "Artists",
+    "Studios",
+    "RemoteTrailers",
+    RELEASE,
+    AIRDATE,
+    CREATED,
+)
+
+# The cards show up to 3 genres or artists, and the first studio and trailer
+MAX_NAMES = 3
+
+_FIELD_SET = frozenset(FIELDS)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _names(values):
+    """Up to MAX_NAMES interned strings; anything but a list is kept as is."""
+    if not isinstance(values, list):
+        return values
+    return tuple(_intern(name) for name in values[:MAX_NAMES])
+
+
+def _first(values, key):
+    """The key of the first of a list of objects, as a tuple of zero or one string."""
+    if not isinstance(values, list) or not values or not isinstance(values[0], dict):
+        return ()
+    first = values[0].get(key)
+    return (_intern(first),) if isinstance(first, str) else ()
+
+
+COMPACT = {
+    "Type": _intern,
+    "SeriesName": _intern,
+    "OfficialRating": _intern,
+    "Genres": _names,
+    "Artists": _names,
+    "Studios": lambda values: _first(values, "Name"),
+    "RemoteTrailers": lambda values: _first(values, "Url"),
+}
+
+# Back to the Emby shape, for the snapshot
+EXPAND = {
+    "Studios": lambda names: [{"Name": name} for name in names],
+    "RemoteTrailers": lambda urls: [{"Url": url} for url in urls],
+}
+
+
+class MediaItem:
+    """The card fields of an Emby item, read like the item dict.
+
+    A field missing from the Emby item is an unset slot, so `in`, `get()` and
+    `[]` behave as they do on the dict.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, item):
+        """Init."""
+        for field in FIELDS:
+            if field in item:
+                value = item[field]
+                compact = COMPACT.get(field)
+                setattr(self, field, value if compact is None else compact(value))
+
+    def __contains__(self, field):
+        return field in _FIELD_SET and hasattr(self, field)
+
+    def __getitem__(self, field):
+        if field not in _FIELD_SET:
+            raise KeyError(field)
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field, default=None):
+        if field not in _FIELD_SET:
+            return default
+        return getattr(self, field, default)
+
+    def to_dict(self):
+        item = {}
+        for field in FIELDS:
+            if hasattr(self, field):
+                value = getattr(self, field)
+                expand = EXPAND.get(field)
+                item[field] = value if expand is None else expand(value)
+        return item
+
+
+def compact_items(items):
+    """Return the items as MediaItems, keeping those that already are."""
+    return [item if isinstance(item, MediaItem) else MediaItem(item) for item in items]
@@ -0,0 +1,151 @@
+"""Push-driven refresh from the LibraryChanged events of the Emby WebSocket."""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+KEEP_ALIVE = 30
+RECONNECT_MIN = 5
+RECONNECT_MAX = 300
+
+# Items added to libraries the client has not seen yet are looked up, up to this many per event
+MAX_LOOKUPS = 10
+
+
+class PushListener:
+    """One WebSocket per server, turning LibraryChanged events into library refreshes.
+
+    The listeners, one per platform entry of the server, are called with the
+    set of libraries whose items changed. While connected the scheduler of
+    the client polls at max_interval only, as a fallback for missed events.
+    """
+
+    def __init__(self, client, session):
+        """Init."""
+        self._client = client
+        self._session = session
+        self.listeners = []
+        self._task = None
+        self.connected = False
+        self.connections = 0
+        self.events = 0
+        self.last_event = None
+
+    def start(self):
+        """Connect in the background, reconnecting with backoff until stopped."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    async def async_stop(self, event=None):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _set_connected(self, connected):
+        self.connected = connected
+        self._client.scheduler.push = connected
+
+    async def _run(self):
+        delay = RECONNECT_MIN
+        while True:
+            try:
+                await self._listen()
+                delay = RECONNECT_MIN
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as err:
+                _LOGGER.info("Emby WebSocket of %s unavailable: %s", self._client.host, err)
+            finally:
+                self._set_connected(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    async def _listen(self):
+        url = self._client.get_websocket_url()
+        async with self._session.ws_connect(url) as socket:
+            self._set_connected(True)
+            self.connections += 1
+            if self.connections > 1:
+                # The events sent while disconnected are lost, catch up once
+                self._changed({view["Id"] for view in self._client.data.get("ViewCategories", [])})
+            keep_alive = KEEP_ALIVE
+            while True:
+                try:
+                    message = await socket.receive(timeout=keep_alive)
+                except asyncio.TimeoutError:
+                    await socket.send_json({"MessageType": "KeepAlive"})
+                    continue
+
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    # Closed, or an error
+                    return
+
+                try:
+                    message = json.loads(message.data)
+                except ValueError:
+                    continue
+                if message.get("MessageType") == "ForceKeepAlive":
+                    keep_alive = max(1, (message.get("Data") or KEEP_ALIVE * 2) / 2)
+                elif message.get("MessageType") == "LibraryChanged":
+                    self._changed(await self.libraries(message.get("Data") or {}))
+
+    def _changed(self, libraries):
+        if not libraries:
+            return
+        self.events += 1
+        self.last_event = datetime.now(timezone.utc)
+        _LOGGER.debug("Libraries changed on %s: %s", self._client.host, libraries)
+        self._client.libraries_changed(libraries)
+        for listener in self.listeners:
+            listener(libraries)
+
+    async def libraries(self, data):
+        """Return the known libraries touched by a LibraryChanged event."""
+        known = {view["Id"] for view in self._client.data.get("ViewCategories", [])}
+        folders = data.get("CollectionFolders", []) + data.get("FoldersAddedTo", []) + data.get(
+            "FoldersRemovedFrom", []
+        )
+        libraries = known.intersection(folders)
+
+        unknown = []
+        for item in data.get("ItemsAdded", []) + data.get("ItemsUpdated", []) + data.get("ItemsRemoved", []):
+            library = self._client.item_libraries.get(item)
+            if library is not None:
+                libraries.add(library)
+            elif item not in data.get("ItemsRemoved", []):
+                unknown.append(item)
+
+        if unknown and not libraries.issuperset(known):
+            for ancestors in await asyncio.gather(
+                *(self._ancestors(item) for item in unknown[:MAX_LOOKUPS])
+            ):
+                libraries.update(known.intersection(ancestors))
+
+        return libraries
+
+    async def _ancestors(self, item):
+        """Return the ids of the folders containing an item."""
+        try:
+            async with self._session.get(
+                self._client.get_ancestors_url(item), timeout=aiohttp.ClientTimeout(total=10)
+            ) as api:
+                if api.status != 200:
+                    return []
+                return [ancestor["Id"] for ancestor in await api.json()]
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, KeyError, TypeError):
+            return []
+
+    def as_dict(self):
+        return {
+            "connected": self.connected,
+            "events": self.events,
+            "last_event": self.last_event.isoformat() if self.last_event else None,
+        }
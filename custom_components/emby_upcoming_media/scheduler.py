@@ -0,0 +1,100 @@
+"""Adaptive polling of libraries."""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+INITIAL_INTERVAL = 3600
+JITTER = 0.1
+
+# Interval factors when the newest item of a library changed or stayed the same
+SPEED_UP = 0.5
+SLOW_DOWN = 1.5
+
+
+class LibrarySchedule:
+    """Poll interval and next poll of one library, or of the libraries of one grouped query."""
+
+    def __init__(self, interval):
+        """Init."""
+        self.interval = interval
+        self.next_poll = 0.0
+        self.newest = None
+        self.changes = 0
+
+
+class PollScheduler:
+    """Polls busy libraries more often and quiet ones less, within bounds.
+
+    A library whose newest DateCreated changed since the last poll has its
+    interval halved, one that did not change has it grown by half. The next
+    poll is jittered so that libraries do not poll in lockstep.
+    """
+
+    def __init__(self, min_interval, max_interval):
+        """Init."""
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.libraries = {}
+        # Set while change events are pushed, polling is then only a fallback
+        self.push = False
+        self._lock = threading.Lock()
+
+    def _clamp(self, interval):
+        if self.push:
+            return self.max_interval
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _library(self, library):
+        if library not in self.libraries:
+            self.libraries[library] = LibrarySchedule(self._clamp(INITIAL_INTERVAL))
+        return self.libraries[library]
+
+    def _schedule(self, schedule, interval):
+        schedule.next_poll = time.time() + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def due(self, libraries):
+        """Return the libraries whose next poll has come."""
+        now = time.time()
+        with self._lock:
+            return [library for library in libraries if self._library(library).next_poll <= now]
+
+    def observe(self, library, newest):
+        """Adapt the interval of a library to whether its newest item changed."""
+        with self._lock:
+            schedule = self._library(library)
+            if schedule.newest is not None and newest != schedule.newest:
+                schedule.changes += 1
+                schedule.interval = self._clamp(schedule.interval * SPEED_UP)
+            elif schedule.newest is not None:
+                schedule.interval = self._clamp(schedule.interval * SLOW_DOWN)
+            schedule.newest = newest
+            self._schedule(schedule, schedule.interval)
+
+    def failed(self, library):
+        """Retry a library that could not be fetched after the shortest interval."""
+        with self._lock:
+            self._schedule(self._library(library), self.min_interval)
+
+    def expedite(self, libraries):
+        """Make libraries due now."""
+        with self._lock:
+            for library in libraries:
+                self._library(library).next_poll = 0.0
+
+    def next_poll(self, library):
+        """Return the next poll of a library as a datetime, or None if unknown."""
+        schedule = self.libraries.get(library)
+        if schedule is None or not schedule.next_poll:
+            return None
+        return datetime.fromtimestamp(schedule.next_poll, timezone.utc)
+
+    def as_dict(self):
+        return {
+            library: {
+                "interval": round(schedule.interval),
+                "changes": schedule.changes,
+                "next_poll": self.next_poll(library).isoformat() if schedule.next_poll else None,
+            }
+            for library, schedule in self.libraries.items()
+        }
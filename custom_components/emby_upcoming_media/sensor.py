@@ -7,23 +7,39 @@ https://github.com/gcorgnet/sensor.emby_upcoming_media
 https://github.com/custom-cards/upcoming-media-card
 
 """
+import hashlib
+import asyncio
+import heapq
 import logging
+import operator
 import json
 import time
 import re
 import requests
-import dateutil.parser
-from datetime import date, datetime
+from datetime import date
 from datetime import timedelta
 import voluptuous as vol
-from itertools import groupby
+from itertools import groupby, islice
 import homeassistant.helpers.config_validation as cv
 from homeassistant.components.sensor import PLATFORM_SCHEMA
 from homeassistant.components import sensor
-from homeassistant.const import CONF_API_KEY, CONF_HOST, CONF_PORT, CONF_SSL
+from homeassistant.const import CONF_API_KEY, CONF_HOST, CONF_PLATFORM, CONF_PORT, CONF_SSL, EVENT_HOMEASSISTANT_STOP, EntityCategory, UnitOfTime
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.entity import Entity
-
-from .client import EmbyClient
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.start import async_at_started
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from homeassistant.util import slugify
+
+from .artwork import FOLDER, ArtworkCache
+from .breaker import CircuitBreaker
+from .client import SNAPSHOT_VERSION, AsyncEmbyClient, EmbyClient, group_key
+from .dates import CREATED
+from .formatter import CARD_SPECS, CardFormatter, spec_fields, url_templates
+from .push import PushListener
 
 __version__ = "0.0.1"
 
@@ -33,6 +49,18 @@ ATTRIBUTION = "Data is provided by Emby."
 
 DICT_LIBRARY_TYPES = {"tvshows": "TV Shows", "movies": "Movies", "music": "Music"}
 
+# Card formatters used for the items of each library type
+DICT_LIBRARY_CARDS = {"TV Shows": ("tv_episode", "tv_show"), "Movies": ("movie",), "Music": ("music",)}
+
+# Item types a grouped Items query asks for, with and without episodes; None where only Latest groups them right
+DICT_LIBRARY_ITEM_TYPES = {"tvshows": ("Episode", None), "movies": ("Movie", "Movie"), "music": (None, "MusicAlbum")}
+
+# Collection types of the libraries that can hold items of any type
+MIXED_COLLECTION_TYPES = (None, "mixed", "folders")
+
+# Card formatter of each Emby item type, "other" for the rest
+DICT_TYPE_CARDS = {"Episode": "tv_episode", "Series": "tv_show", "Movie": "movie", "MusicAlbum": "music", "Audio": "music"}
+
 # Configuration
 CONF_SENSOR = "sensor"
 CONF_ENABLED = "enabled"
@@ -44,13 +72,40 @@ CONF_USE_BACKDROP = "use_backdrop"
 CONF_GROUP_LIBRARIES = "group_libraries"
 CONF_EPISODES = "episodes"
 CONF_SUPPRESS_CONNECTION_ERRORS = "suppress_connection_errors"
+CONF_CARD_CACHE_SIZE = "card_cache_size"
+CONF_POOL_SIZE = "pool_size"
+CONF_RETRIES = "retries"
+CONF_ASYNC_CLIENT = "async_client"
+CONF_MAX_CONCURRENCY = "max_concurrency"
+CONF_REQUEST_TTL = "request_ttl"
+CONF_SNAPSHOT = "snapshot"
+CONF_FIELDS = "fields"
+CONF_DIAGNOSTICS = "diagnostics"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_PUSH = "push"
+CONF_GROUP_QUERY = "group_query"
+CONF_DATA_MAX_ENTRIES = "data_max_entries"
+CONF_DATA_MAX_AGE = "data_max_age"
+CONF_ARTWORK_CACHE = "artwork_cache"
+CONF_ARTWORK_CACHE_SIZE = "artwork_cache_size"
+CONF_ARTWORK_QUALITY = "artwork_quality"
+CONF_SUMMARY_LENGTH = "summary_length"
+CONF_COMPACT_ATTRIBUTES = "compact_attributes"
+CONF_URL_TEMPLATES = "url_templates"
+CONF_ENTITY_SUFFIX = "entity_suffix"
 
 CATEGORY_NAME = "CategoryName"
 CATEGORY_ID = "CategoryId"
 CATEGORY_TYPE = "CollectionType"
+ITEM_TYPES = "IncludeItemTypes"
+ENTITY_SUFFIX = "EntitySuffix"
 
 
-SCAN_INTERVAL_SECONDS = 3600  # Scan once per hour
+# Seconds the snapshot is written after a change, so the libraries of one refresh are written together
+SNAPSHOT_DELAY = 10
+
+SCAN_INTERVAL_SECONDS = 60  # Check every minute, the scheduler of the client decides which libraries are due
 
 TV_DEFAULT = {"title_default": "$title", "line1_default": "$release", "line2_default": "$number", "line3_default": "$episode", "line4_default": "Runtime: $runtime", "icon": "mdi:arrow-down-bold"}
 TV_ALTERNATE = {"title_default": "$title", "line1_default": "$release • $number", "line2_default": "Average Runtime: $runtime", "line3_default": "$genres", "line4_default": "$rating", "icon": "mdi:arrow-down-bold"}
@@ -58,6 +113,17 @@ MOVIE_DEFAULT = {"title_default": "$title", "line1_default": "$release", "line2_
 MUSIC_DEFAULT = {"title_default": "$title", "line1_default": "$studio • $release", "line2_default": "Runtime: $runtime", "line3_default": "$genres", "line4_default": "", "icon": "mdi:arrow-down-bold"}
 OTHER_DEFAULT = {"title_default": "$title", "line1_default": "$release", "line2_default": "Runtime: $runtime", "line3_default": "$genres", "line4_default": "$studio", "icon": "mdi:arrow-down-bold"}
 
+DICT_CARD_DEFAULTS = {"tv_episode": TV_DEFAULT, "tv_show": TV_ALTERNATE, "movie": MOVIE_DEFAULT, "music": MUSIC_DEFAULT, "other": OTHER_DEFAULT}
+
+# Card item keys read by the card itself, whatever its lines show
+CARD_KEYS = ("title", "airdate", "poster", "fanart", "deep_link", "id")
+
+# Card item keys kept by compact_attributes for each layout
+DICT_LAYOUT_KEYS = {
+    kind: frozenset(CARD_KEYS).union(re.findall(r"\$(\w+)", " ".join(defaults.values())))
+    for kind, defaults in DICT_CARD_DEFAULTS.items()
+}
+
 _LOGGER = logging.getLogger(__name__)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
@@ -73,41 +139,261 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Optional(CONF_GROUP_LIBRARIES, default=False): cv.boolean,
         vol.Optional(CONF_EPISODES, default=True): cv.boolean,
         vol.Optional(CONF_SUPPRESS_CONNECTION_ERRORS, default=False): cv.boolean,
+        vol.Optional(CONF_CARD_CACHE_SIZE, default=500): cv.positive_int,
+        vol.Optional(CONF_POOL_SIZE, default=10): vol.All(cv.positive_int, vol.Range(min=1)),
+        vol.Optional(CONF_RETRIES, default=0): cv.positive_int,
+        vol.Optional(CONF_ASYNC_CLIENT, default=True): cv.boolean,
+        vol.Optional(CONF_MAX_CONCURRENCY, default=4): vol.All(cv.positive_int, vol.Range(min=1)),
+        vol.Optional(CONF_REQUEST_TTL, default=10): cv.positive_int,
+        vol.Optional(CONF_SNAPSHOT, default=True): cv.boolean,
+        vol.Optional(CONF_FIELDS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(CONF_DIAGNOSTICS, default=False): cv.boolean,
+        vol.Optional(CONF_MIN_INTERVAL, default=300): cv.positive_int,
+        vol.Optional(CONF_MAX_INTERVAL, default=14400): cv.positive_int,
+        vol.Optional(CONF_PUSH, default=False): cv.boolean,
+        vol.Optional(CONF_GROUP_QUERY, default=True): cv.boolean,
+        vol.Optional(CONF_DATA_MAX_ENTRIES, default=50): vol.All(cv.positive_int, vol.Range(min=1)),
+        vol.Optional(CONF_DATA_MAX_AGE, default=604800): cv.positive_int,
+        vol.Optional(CONF_ARTWORK_CACHE, default=False): cv.boolean,
+        vol.Optional(CONF_ARTWORK_CACHE_SIZE, default=50): vol.All(cv.positive_int, vol.Range(min=1)),
+        vol.Optional(CONF_ARTWORK_QUALITY, default=75): vol.All(cv.positive_int, vol.Range(min=1, max=100)),
+        vol.Optional(CONF_SUMMARY_LENGTH, default=0): cv.positive_int,
+        vol.Optional(CONF_COMPACT_ATTRIBUTES, default=False): cv.boolean,
+        vol.Optional(CONF_URL_TEMPLATES, default=False): cv.boolean,
+        vol.Optional(CONF_ENTITY_SUFFIX): cv.string,
     }
 )
 
 
-def setup_platform(hass, config, add_devices, discovery_info=None):
+# Options shaping the client, entries for the same server and user share it only if they agree on all of them
+CLIENT_OPTIONS = (
+    CONF_API_KEY,
+    CONF_SSL,
+    CONF_MAX,
+    CONF_EPISODES,
+    CONF_SUPPRESS_CONNECTION_ERRORS,
+    CONF_CARD_CACHE_SIZE,
+    CONF_POOL_SIZE,
+    CONF_RETRIES,
+    CONF_ASYNC_CLIENT,
+    CONF_MAX_CONCURRENCY,
+    CONF_REQUEST_TTL,
+    CONF_SNAPSHOT,
+    CONF_MIN_INTERVAL,
+    CONF_MAX_INTERVAL,
+    CONF_PUSH,
+    CONF_DATA_MAX_ENTRIES,
+    CONF_DATA_MAX_AGE,
+)
 
-    # Create DATA dict
-    hass.data[DOMAIN_DATA] = {}
 
-    # Get "global" configuration.
-    api_key = config.get(CONF_API_KEY)
-    host = config.get(CONF_HOST)
-    ssl = config.get(CONF_SSL)
-    port = config.get(CONF_PORT)
-    max_items = config.get(CONF_MAX)
-    user_id = config.get(CONF_USER_ID)
-    include = config.get(CONF_INCLUDE)
-    show_episodes = config.get(CONF_EPISODES)
-    suppress_connection_errors = config.get(CONF_SUPPRESS_CONNECTION_ERRORS)
-
-    # Configure the client.
-    client = EmbyClient(
-        host,
-        api_key,
-        ssl,
-        port,
-        max_items,
-        user_id,
-        show_episodes,
-        suppress_connection_errors,
+def client_args(config):
+    """Return the client arguments shared by the sync and async clients."""
+    return (
+        config.get(CONF_HOST),
+        config.get(CONF_API_KEY),
+        config.get(CONF_SSL),
+        config.get(CONF_PORT),
+        config.get(CONF_MAX),
+        config.get(CONF_USER_ID),
+        config.get(CONF_EPISODES),
+        config.get(CONF_SUPPRESS_CONNECTION_ERRORS),
+        config.get(CONF_CARD_CACHE_SIZE),
+        config.get(CONF_MAX_CONCURRENCY),
+        config.get(CONF_REQUEST_TTL),
+    )
+
+
+def client_kwargs(hass, config):
+    """Return the client keyword arguments shared by the sync and async clients."""
+    return {
+        "min_interval": config.get(CONF_MIN_INTERVAL),
+        "max_interval": max(config.get(CONF_MIN_INTERVAL), config.get(CONF_MAX_INTERVAL)),
+        "max_entries": config.get(CONF_DATA_MAX_ENTRIES),
+        # Libraries polled at the longest interval must not age out between two polls
+        "max_age": max(config.get(CONF_DATA_MAX_AGE), 2 * config.get(CONF_MAX_INTERVAL)),
+        "breaker": server_breaker(hass, config),
+    }
+
+
+def server_breaker(hass, config):
+    """Return the circuit breaker of the server in config, shared by the clients of all its users and options."""
+    breakers = hass.data.setdefault(DOMAIN_DATA, {}).setdefault("breakers", {})
+    return breakers.setdefault((config.get(CONF_HOST), config.get(CONF_PORT)), CircuitBreaker())
+
+
+def client_key(config):
+    """Return the registry key of the server, user and client options in config."""
+    return (
+        config.get(CONF_HOST),
+        config.get(CONF_PORT),
+        config.get(CONF_USER_ID),
+        tuple(config.get(option) for option in CLIENT_OPTIONS),
     )
-    hass.data[DOMAIN_DATA]["client"] = client
 
-    categories = client.get_view_categories()
-    
+
+def clients(hass):
+    """Return the clients of all platform entries, one per server, user and client options."""
+    return hass.data.setdefault(DOMAIN_DATA, {}).setdefault("clients", {})
+
+
+def client_options_digest(config):
+    """Return a short digest of the client options in config."""
+    return hashlib.sha1(repr(client_key(config)[3]).encode("utf-8")).hexdigest()[:8]
+
+
+def entity_suffix(config):
+    """Return what keeps the entity ids of the entry apart from those of other servers, users and client options.
+
+    It only depends on the entry, so the ids stay the same whatever order the
+    entries are set up in.
+    """
+    if CONF_ENTITY_SUFFIX in config:
+        return "_" + slugify(config[CONF_ENTITY_SUFFIX]) if config[CONF_ENTITY_SUFFIX] else ""
+    defaults = PLATFORM_SCHEMA({CONF_PLATFORM: DOMAIN, CONF_API_KEY: config.get(CONF_API_KEY)})
+    suffix = config.get(CONF_HOST)
+    if config.get(CONF_PORT) != defaults[CONF_PORT]:
+        suffix += "_{0}".format(config.get(CONF_PORT))
+    suffix += "_" + (config.get(CONF_USER_ID) or "")[:8]
+    if client_key(config)[3] != client_key(defaults)[3]:
+        # Entries for the same server and user with other client options get their own client and sensors
+        suffix += "_" + client_options_digest(config)
+    return "_" + slugify(suffix)
+
+
+def unique_entity_ids(hass, entities):
+    """Number the entity ids another entry already uses, like Home Assistant does."""
+    taken = hass.data.setdefault(DOMAIN_DATA, {}).setdefault("entity_ids", set())
+    for entity in entities:
+        entity_id = entity.entity_id
+        number = 2
+        while entity.entity_id in taken:
+            entity.entity_id = "{0}_{1}".format(entity_id, number)
+            number += 1
+        taken.add(entity.entity_id)
+
+
+@callback
+def retain_referenced(hass, client):
+    """Free the libraries of the snapshot no sensor of the client shows, once all entries are set up."""
+
+    @callback
+    def retain(_hass):
+        client.data.retain(client.referenced_keys)
+
+    async_at_started(hass, retain)
+
+
+def artwork_cache(hass, config):
+    """Return the artwork cache shared by all entries and whether it still has to load() its folder.
+
+    (None, False) if config does not use it. The entries share one folder, so
+    the size and quality of the first entry using it apply to all of them.
+    """
+    if not config.get(CONF_ARTWORK_CACHE):
+        return None, False
+
+    domain_data = hass.data.setdefault(DOMAIN_DATA, {})
+    if "artwork" in domain_data:
+        artwork = domain_data["artwork"]
+        if (
+            artwork.max_bytes != config.get(CONF_ARTWORK_CACHE_SIZE) * 1024 * 1024
+            or artwork.quality != config.get(CONF_ARTWORK_QUALITY)
+        ):
+            _LOGGER.warning(
+                "The artwork cache of all entries keeps %d MB at quality %d, ignoring the %s and %s of the entry for %s",
+                artwork.max_bytes // (1024 * 1024),
+                artwork.quality,
+                CONF_ARTWORK_CACHE_SIZE,
+                CONF_ARTWORK_QUALITY,
+                config.get(CONF_HOST),
+            )
+        return artwork, False
+
+    domain_data["artwork"] = ArtworkCache(
+        hass.config.path("www", FOLDER),
+        config.get(CONF_ARTWORK_CACHE_SIZE) * 1024 * 1024,
+        config.get(CONF_ARTWORK_QUALITY),
+    )
+    return domain_data["artwork"], True
+
+
+def snapshot_store(hass, config):
+    """Return the snapshot store of the server, user and client options in config, or None."""
+    if not config.get(CONF_SNAPSHOT):
+        return None
+
+    # Clients of the same server and user with other options keep their own snapshot
+    name = slugify(
+        "{0}_{1}_{2}_{3}".format(
+            config.get(CONF_HOST), config.get(CONF_PORT), config.get(CONF_USER_ID), client_options_digest(config)
+        )
+    )
+    return Store(hass, SNAPSHOT_VERSION, "{0}.{1}".format(DOMAIN, name))
+
+
+async def async_load_snapshot(client, store):
+    """Restore the data of the client from its snapshot store and save it there once it changes."""
+    try:
+        client.load_snapshot(await store.async_load())
+    except HomeAssistantError as err:
+        _LOGGER.warning("Could not load the snapshot of %s: %s", client.host, err)
+
+    @callback
+    def delay_save():
+        # The data is built on the event loop when the delay is over
+        store.async_delay_save(client.snapshot, SNAPSHOT_DELAY)
+
+    client.snapshot_listener = lambda: store.hass.add_job(delay_save)
+
+
+def add_sensors(add_devices, sensors):
+    """Add the sensors restored from the snapshot right away, the others after their first update."""
+    add_devices([sensor for sensor in sensors if sensor.restored], False)
+    add_devices([sensor for sensor in sensors if not sensor.restored], True)
+
+
+@callback
+def start_push(hass, client, sensors):
+    """Refresh the sensors of the libraries the Emby WebSocket reports as changed."""
+    sensors = [sensor for sensor in sensors if isinstance(sensor, EmbyUpcomingMediaSensor)]
+
+    @callback
+    def library_changed(libraries):
+        for sensor in sensors:
+            if sensor.hass is not None and libraries.intersection(sensor.libraries):
+                hass.async_create_task(sensor.async_refresh())
+
+    if client.push is None:
+        client.push = PushListener(client, async_get_clientsession(hass))
+        client.push.start()
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, client.push.async_stop)
+    client.push.listeners.append(library_changed)
+
+
+def group_item_types(config, category, views):
+    """Return the item types of a grouped sensor fetched with one Items query, or None.
+
+    The Items query can only be scoped by item type, it returns the items of
+    all libraries of the user. So it is used when the group holds all
+    libraries of its type and the user has no mixed library, which could
+    hold items of the type too.
+    """
+    if not config.get(CONF_GROUP_LIBRARIES) or not config.get(CONF_GROUP_QUERY) or config.get(CONF_INCLUDE) != []:
+        return None
+
+    if any(view.get("CollectionType") in MIXED_COLLECTION_TYPES for view in views):
+        return None
+
+    return DICT_LIBRARY_ITEM_TYPES[category["CollectionType"]][0 if config.get(CONF_EPISODES) else 1]
+
+
+def create_sensors(hass, client, config, categories, artwork=None):
+    """Return one sensor per supported (or grouped) library."""
+    include = config.get(CONF_INCLUDE)
+    views = list(categories)
+    categories = views
+
     categories = filter(lambda el: 'CollectionType' in el.keys() and el["CollectionType"] in DICT_LIBRARY_TYPES.keys(), categories) #just include supported library types (movie/tv)
 
     if include != []:
@@ -117,33 +403,197 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
         l=[list(y) for x,y in groupby(sorted(list(categories),key=lambda x: (x['CollectionType'])),lambda x: (x['CollectionType']))]
         categories = [{k:(v if k!='Id' else list(set([x['Id'] for x in i]))) for k,v in i[0].items()} for i in l]
 
-    mapped = map(
-        lambda cat: EmbyUpcomingMediaSensor(
-            hass, {**config, CATEGORY_NAME: cat["Name"], CATEGORY_ID: cat["Id"], CATEGORY_TYPE: DICT_LIBRARY_TYPES[cat["CollectionType"]]}
-        ),
-        categories,
-    )
+    sensors = [
+        EmbyUpcomingMediaSensor(
+            client, {**config, CATEGORY_NAME: cat["Name"], CATEGORY_ID: cat["Id"], CATEGORY_TYPE: DICT_LIBRARY_TYPES[cat["CollectionType"]], ITEM_TYPES: group_item_types(config, cat, views), ENTITY_SUFFIX: entity_suffix(config)}, artwork
+        )
+        for cat in categories
+    ]
+
+    for entity in sensors:
+        client.referenced_keys.update(entity.data_keys())
+    hass.add_job(retain_referenced, hass, client)
+
+    # One diagnostics sensor per client, whichever of its entries asks for it
+    diagnosed = hass.data.setdefault(DOMAIN_DATA, {}).setdefault("diagnostics", set())
+    if config.get(CONF_DIAGNOSTICS) and client_key(config) not in diagnosed:
+        diagnosed.add(client_key(config))
+        sensors.append(EmbyDiagnosticsSensor(client, entity_suffix(config), artwork))
+
+    unique_entity_ids(hass, sensors)
+    return sensors
+
+
+def setup_platform(hass, config, add_devices, discovery_info=None):
+
+    # Entries for the same server and user share their client
+    client = clients(hass).get(client_key(config))
+    if not isinstance(client, EmbyClient):
+        # Configure the client.
+        client = EmbyClient(
+            *client_args(config),
+            **client_kwargs(hass, config),
+            pool_size=config.get(CONF_POOL_SIZE),
+            retries=config.get(CONF_RETRIES),
+        )
+        clients(hass)[client_key(config)] = client
+        hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, client.close)
+        store = snapshot_store(hass, config)
+        if store is not None:
+            asyncio.run_coroutine_threadsafe(async_load_snapshot(client, store), hass.loop).result()
+
+    artwork, new_artwork = artwork_cache(hass, config)
+    if new_artwork:
+        artwork.load()
+
+    if "ViewCategories" in client.data:
+        # Show the cached libraries right away and refresh them in the background
+        categories = client.data["ViewCategories"]
+        hass.add_job(client.get_view_categories)
+    else:
+        categories = client.get_view_categories()
 
-    add_devices(mapped, True)
+    sensors = create_sensors(hass, client, config, categories, artwork)
+    add_sensors(add_devices, sensors)
+
+    if config.get(CONF_PUSH):
+        hass.add_job(start_push, hass, client, sensors)
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+
+    if not config.get(CONF_ASYNC_CLIENT):
+        # Keep the blocking client, set up in the executor.
+        def add_devices(entities, update_before_add=False):
+            hass.add_job(async_add_entities, list(entities), update_before_add)
+
+        await hass.async_add_executor_job(
+            setup_platform, hass, config, add_devices, discovery_info
+        )
+        return
+
+    # Entries for the same server and user share their client
+    client = clients(hass).get(client_key(config))
+    if not isinstance(client, AsyncEmbyClient):
+        # Configure the client.
+        client = AsyncEmbyClient(
+            async_get_clientsession(hass),
+            *client_args(config),
+            **client_kwargs(hass, config),
+            retries=config.get(CONF_RETRIES),
+        )
+        clients(hass)[client_key(config)] = client
+        store = snapshot_store(hass, config)
+        if store is not None:
+            await async_load_snapshot(client, store)
+
+    artwork, new_artwork = artwork_cache(hass, config)
+    if new_artwork:
+        await hass.async_add_executor_job(artwork.load)
+
+    if "ViewCategories" in client.data:
+        # Show the cached libraries right away and refresh them in the background
+        categories = client.data["ViewCategories"]
+        hass.async_create_task(client.async_get_view_categories())
+    else:
+        categories = await client.async_get_view_categories()
+
+    sensors = create_sensors(hass, client, config, categories, artwork)
+    add_sensors(async_add_entities, sensors)
+
+    if config.get(CONF_PUSH):
+        start_push(hass, client, sensors)
 
 
 SCAN_INTERVAL = timedelta(seconds=SCAN_INTERVAL_SECONDS)
 
 
+def created(item):
+    """Sort key of an item, newest first when reversed."""
+    return item.get(CREATED, 0.0)
+
+
+def field_profile(category_type):
+    """Return the Emby fields read by the cards of a library type."""
+    # DateCreated and Etag are the change markers of an item
+    fields = ["DateCreated", "Etag"]
+    for card in DICT_LIBRARY_CARDS.get(category_type, CARD_SPECS.keys()):
+        for field in spec_fields(CARD_SPECS[card]):
+            if field not in fields:
+                fields.append(field)
+
+    return ",".join(fields)
+
+
+def fingerprint(data):
+    """Return a digest of the ordered item ids and their change markers, used to detect new content."""
+    return hash(tuple((item.get("Id"), item.get("DateCreated"), item.get("Etag")) for item in data))
+
+
 class EmbyUpcomingMediaSensor(Entity):
-    def __init__(self, hass, conf):
-        self._client = hass.data[DOMAIN_DATA]["client"]
+    # Refreshed on SCAN_INTERVAL by the sensor itself, writing the state only when it changed
+    _attr_should_poll = False
+
+    def __init__(self, client, conf, artwork=None):
+        self._client = client
+        self._artwork = artwork
         self._state = None
         self.data = []
+        self._data_fingerprint = None
+        # The client entries the data was last taken from
+        self._sources = []
+        self._changed = False
+        self._unchanged = False
+        self.last_changed = None
+        self._attributes = None
+        self._attributes_fingerprint = None
         self.use_backdrop = conf.get(CONF_USE_BACKDROP)
+        self.compact_attributes = conf.get(CONF_COMPACT_ATTRIBUTES)
+        self.url_templates = url_templates(client) if conf.get(CONF_URL_TEMPLATES) else None
+        # Card items differ by these settings, the card cache is shared by all sensors of the client
+        self.card_variant = (self.use_backdrop, conf.get(CONF_SUMMARY_LENGTH, 0), bool(self.url_templates))
+        self.formatters = {
+            kind: CardFormatter(spec, self._client, *self.card_variant) for kind, spec in CARD_SPECS.items()
+        }
         self.category_name = (conf.get(CATEGORY_TYPE) if conf.get(CONF_GROUP_LIBRARIES) == True else conf.get(CATEGORY_NAME))
         self.category_id = conf.get(CATEGORY_ID)
+        self.libraries = [self.category_id] if isinstance(self.category_id, str) else self.category_id
+        self.item_types = conf.get(ITEM_TYPES)
+        self.fields = (
+            ",".join(conf[CONF_FIELDS]) if conf.get(CONF_FIELDS) else field_profile(conf.get(CATEGORY_TYPE))
+        )
         self.friendly_name = "Emby Latest Media " + self.category_name
         self.entity_id = sensor.ENTITY_ID_FORMAT.format(
             "emby_latest_"
             + re.sub(r"\_$", "", re.sub(r"\W+", "_", self.category_name)
             ).lower()  # remove special characters
+            + conf.get(ENTITY_SUFFIX, "")
         )
+        self.restored = self.restore()
+
+    def restore(self):
+        """Show the items of the snapshot until the first update."""
+        data = self.client_data()
+        if not data:
+            return False
+
+        self.set_data(data)
+        return True
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(async_track_time_interval(self.hass, self.async_refresh, SCAN_INTERVAL))
+        if self.restored:
+            self.hass.async_create_task(self.async_refresh())
+
+    async def async_refresh(self, now=None):
+        """Update, and write the state only if the content or the state changed."""
+        await self.async_update()
+        if self._changed:
+            self._changed = False
+            self.async_write_ha_state()
+        elif self._unchanged:
+            self._client.diagnostics.add_skipped_write(self.entity_id)
+        self._unchanged = False
 
     @property
     def name(self):
@@ -153,406 +603,274 @@ class EmbyUpcomingMediaSensor(Entity):
     def state(self):
         return self._state
 
-    def handle_tv_episodes(self):
-        """Return the state attributes."""
-
-        attributes = {}
-        default = TV_DEFAULT
-        card_json = []
+    def build_card_json(self):
+        """Build the card payload, formatting the items of each type together."""
 
-        card_json.append(default)
+        card_cache = self._client.card_cache
+        card_items = [None] * len(self.data)
+        batches = {}
+        for index, show in enumerate(self.data):
+            batches.setdefault(DICT_TYPE_CARDS.get(show.get("Type"), "other"), []).append(index)
 
-        for show in self.data:
+        for kind, indexes in batches.items():
+            formatter = self.formatters[kind]
+            for index in indexes:
+                show = self.data[index]
+                key = (kind, self.card_variant, show.get("Id"), show.get("DateCreated"), show.get("Etag"))
+                card_item = card_cache.get(key)
+                if card_item is None:
+                    card_item = formatter.format(show)
+                    card_cache.put(key, card_item)
+                card_items[index] = card_item
 
-            card_item = {}
-            card_item["title"] = show["SeriesName"]
-            card_item['episode'] = show.get('Name', '')
+        _LOGGER.debug("Card cache for %s: %s", self.entity_id, card_cache.stats())
 
-            card_item["airdate"] = show.get("PremiereDate", datetime.now().isoformat())
+        if self._artwork is not None:
+            card_items = self.localize_artwork(card_items)
 
-            if "PremiereDate" in show:
-                card_item["release"] = str(dateutil.parser.isoparse(show.get("PremiereDate", "")).year)
-            else:
-                card_item["release"] = ""
-
-            if "RunTimeTicks" in show:
-                timeobject = timedelta(microseconds=show["RunTimeTicks"] / 10)
-                card_item["runtime"] = timeobject.total_seconds() / 60
-            else:
-                card_item["runtime"] = ""
-
-            if "ParentIndexNumber" and "IndexNumber" in show:
-                card_item["number"] = "S{:02d}E{:02d}".format(
-                    show["ParentIndexNumber"], show["IndexNumber"]
-                )
-            elif "ParentIndexNumber" in show and "IndexNumber" not in show:
-                card_item["number"] = "Season {:d} Special".format(
-                    show["ParentIndexNumber"]
-                )
-
-            # Add summary
-            if "Overview" in show:
-                card_item["summary"] = show["Overview"]
-                
-            # Add trailer
-            if "RemoteTrailers" in show and len(show["RemoteTrailers"]) > 0:
-                card_item["trailer"] = show["RemoteTrailers"][0]["Url"]
-                
-            if "ParentBackdropItemId" in show:
-                card_item["poster"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                    show["ParentBackdropItemId"], "Backdrop" if self.use_backdrop else "Primary"
-                )
-                # Add fanart
-                card_item["fanart"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                    show["ParentBackdropItemId"], "Backdrop"
-                )
-                
-            # Add deep_link
-            base_url = "http{0}://{1}:{2}".format(
-                "s" if self.hass.data[DOMAIN_DATA]["client"].ssl else "",
-                self.hass.data[DOMAIN_DATA]["client"].host,
-                self.hass.data[DOMAIN_DATA]["client"].port
-            )
-            card_item["deep_link"] = "{0}/web/index.html#!/details?id={1}".format(
-                base_url, show["Id"]
-            )
-            card_item["id"] = show.get("Id", "")
+        # The card layout follows the most common type
+        kind = max(batches, key=lambda kind: len(batches[kind]))
 
-            card_json.append(card_item)
+        if self.compact_attributes:
+            keys = DICT_LAYOUT_KEYS[kind]
+            card_items = [{key: value for key, value in card_item.items() if key in keys} for card_item in card_items]
 
-        return {
-            "data": card_json,
+        card_json = {
+            "data": [DICT_CARD_DEFAULTS[kind]] + card_items,
             "attribution": ATTRIBUTION
         }
+        if self.url_templates:
+            card_json["url_templates"] = self.url_templates
+        return card_json
+
+    def localize_artwork(self, card_items):
+        """Point the cards to the downloaded artwork, and download the rest in the background."""
+        localized = []
+        missing = []
+        for card_item in card_items:
+            card_item, urls = self._artwork.localize(card_item)
+            localized.append(card_item)
+            missing.extend(urls)
+
+        if missing and self.hass is not None:
+            # Only claimed once the download is scheduled, until then another sensor may fetch them
+            missing = self._artwork.claim(missing)
+            if missing:
+                self.hass.add_job(self.fetch_artwork, missing)
+
+        return localized
+
+    def fetch_artwork(self, urls):
+        """Download artwork, then rebuild the attributes to use it."""
+        if self._artwork.prefetch(urls):
+            self._attributes = None
+            self.schedule_update_ha_state()
 
-    def handle_tv_show(self):
-        """Return the state attributes."""
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes, rebuilt only when the data changed."""
+
+        if self._attributes is None or self._attributes_fingerprint != self._data_fingerprint:
+            with self._client.diagnostics.span("attributes"):
+                self._attributes = self.build_attributes()
+            self._attributes_fingerprint = self._data_fingerprint
+            self._client.diagnostics.set_attribute_bytes(
+                self.entity_id, len(json.dumps(self._attributes, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+            )
 
-        attributes = {}
-        default = TV_ALTERNATE
-        card_json = []
+        return self._attributes
 
-        card_json.append(default)
+    def build_attributes(self):
+        """Build the card payload from the current data."""
 
-        for show in self.data:
+        if len(self.data) == 0:
+            return {}
 
-            card_item = {}
-            card_item["title"] = show["Name"]
-            card_item["airdate"] = show.get("PremiereDate", datetime.now().isoformat())
+        attributes = self.build_card_json()
+        if self.last_changed is not None:
+            attributes["last_changed_content"] = self.last_changed.isoformat()
+        return attributes
 
-            if "PremiereDate" in show:
-                card_item["release"] = str(dateutil.parser.isoparse(show.get("PremiereDate", "")).year)
+    def due_libraries(self):
+        """Return the libraries, or the key of the grouped query, to fetch now; none if the current data is recent enough."""
+        keys = [group_key(self.libraries)] if self.group_query() else self.libraries
+        due = self._client.scheduler.due(keys)
+        if not due and not self.data:
+            # Nothing to show yet, for instance after an error
+            return keys
+        return due
+
+    def client_sources(self):
+        """Return the client entries the data of the sensor comes from, and whether they are merged."""
+        if isinstance(self.category_id, str):
+            return [self._client.data.get(self.category_id)], False
+        if self.item_types and group_key(self.category_id) in self._client.data:
+            return [self._client.data.get(group_key(self.category_id))], False
+        return self.last_data(), True
+
+    def client_data(self):
+        """Return the data the client holds for the sensor, whichever sensor fetched it."""
+        sources, merged = self.client_sources()
+        self._sources = sources
+        return self.merge_libraries(sources) if merged else sources[0]
+
+    def sync_client_data(self):
+        """Take the data another sensor of the same libraries fetched since the last update."""
+        sources, _merged = self.client_sources()
+        # The client stores new lists when a library changed, so on an idle tick there is nothing to merge
+        if len(sources) == len(self._sources) and all(map(operator.is_, sources, self._sources)):
+            return
+        data = self.client_data()
+        if data and fingerprint(data) != self._data_fingerprint:
+            self.set_data(data)
+
+    def cached_libraries(self, results):
+        """Merge the last data of all grouped libraries once the due ones are fetched."""
+        if not results:
+            return None
+        with self._client.diagnostics.span("merge"):
+            return self.merge_libraries(self.last_data())
+
+    def last_data(self):
+        """Return the last data the client has of each library of the sensor."""
+        last = [self._client.data.get(element) for element in self.libraries]
+        return [data for data in last if data is not None]
+
+    def data_keys(self):
+        """Return the keys of the client data this sensor reads."""
+        if self.item_types:
+            return self.libraries + [group_key(self.libraries)]
+        return self.libraries
+
+    def group_query(self):
+        """Whether the grouped libraries are fetched with one Items query."""
+        return self.item_types is not None and self._client.group_query
 
-            if show["ChildCount"] > 1:
-                card_item['number'] = "{0} seasons".format(
-                    show["ChildCount"]
-                )
+    def update(self):
+        due = self.due_libraries()
+        if not due:
+            self.sync_client_data()
+            return
+
+        with self._client.diagnostics.span("refresh"):
+            if isinstance(self.category_id, str): 
+                data = self._client.get_data(self.category_id, self.fields)
+            elif self.group_query():
+                data = self._client.get_group_data(self.libraries, self.item_types, self.fields)
+                if not self._client.group_query:
+                    data = self.cached_libraries(self._client.get_data_many(self.libraries, self.fields))
             else:
-                card_item['number'] = "{0} season".format(
-                    show["ChildCount"]
-                )
-
-            if "RunTimeTicks" in show:
-                timeobject = timedelta(microseconds=show["RunTimeTicks"] / 10)
-                card_item["runtime"] = timeobject.total_seconds() / 60
+                data = self.cached_libraries(self._client.get_data_many(due, self.fields))
+
+            self.set_data(data)
+            self._sources = self.client_sources()[0]
+
+    async def async_update(self):
+        due = self.due_libraries()
+        if not due:
+            self.sync_client_data()
+            return
+
+        if not isinstance(self._client, AsyncEmbyClient):
+            await self.hass.async_add_executor_job(self.update)
+            return
+
+        with self._client.diagnostics.span("refresh"):
+            if isinstance(self.category_id, str): 
+                data = await self._client.async_get_data(self.category_id, self.fields)
+            elif self.group_query():
+                data = await self._client.async_get_group_data(self.libraries, self.item_types, self.fields)
+                if not self._client.group_query:
+                    data = self.cached_libraries(await self._client.async_get_data_many(self.libraries, self.fields))
             else:
-                card_item["runtime"] = ""
-
-            if "Genres" in show:
-                card_item["genres"] = ", ".join(show["Genres"][:3])
-
-            if "ParentIndexNumber" and "IndexNumber" in show:
-                card_item["number"] = "S{:02d}E{:02d}".format(
-                    show["ParentIndexNumber"], show["IndexNumber"]
-                )
-
-            if "CommunityRating" in show:
-                card_item["rating"] = "{} {:.1f}".format(
-                    "\u2605", # Star character
-                    show.get("CommunityRating", ''),
-                )
-
-            # Add summary
-            if "Overview" in show:
-                card_item["summary"] = show["Overview"]
-                
-            # Add trailer
-            if "RemoteTrailers" in show and len(show["RemoteTrailers"]) > 0:
-                card_item["trailer"] = show["RemoteTrailers"][0]["Url"]
-                
-            card_item["poster"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                show["Id"], "Backdrop" if self.use_backdrop else "Primary"
-                )
-            # Add fanart
-            card_item["fanart"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                show["Id"], "Backdrop"
-            )
-            
-            # Add deep_link
-            base_url = "http{0}://{1}:{2}".format(
-                "s" if self.hass.data[DOMAIN_DATA]["client"].ssl else "",
-                self.hass.data[DOMAIN_DATA]["client"].host,
-                self.hass.data[DOMAIN_DATA]["client"].port
-            )
-            card_item["deep_link"] = "{0}/web/index.html#!/details?id={1}".format(
-                base_url, show["Id"]
-            )
-            card_item["id"] = show.get("Id", "")
-
-            card_json.append(card_item)
+                data = self.cached_libraries(await self._client.async_get_data_many(due, self.fields))
 
-        return {
-            "data": card_json,
-            "attribution": ATTRIBUTION
-        }
-
-    def handle_movie(self):
-        """Return the state attributes."""
-
-        attributes = {}
-        default = MOVIE_DEFAULT
-        card_json = []
+            self.set_data(data)
+            self._sources = self.client_sources()[0]
 
-        card_json.append(default)
+    def merge_libraries(self, results):
+        """Merge the items of grouped libraries, keeping only the newest max items."""
+        if not results:
+            return None
 
-        for show in self.data:
+        # Latest is already newest first, so this is a cheap linear pass per library
+        streams = [sorted(result, key=created, reverse=True) for result in results]
 
-            card_item = {}
-            card_item["title"] = show["Name"]
-            card_item["airdate"] = show.get("PremiereDate", datetime.now().isoformat())
+        return list(islice(heapq.merge(*streams, key=created, reverse=True), int(self._client.max_items)))
 
-            if "PremiereDate" in show:
-                card_item["release"] = str(dateutil.parser.isoparse(show.get("PremiereDate", "")).year)
-
-            if "RunTimeTicks" in show:
-                timeobject = timedelta(microseconds=show["RunTimeTicks"] / 10)
-                card_item["runtime"] = timeobject.total_seconds() / 60
+    def set_data(self, data):
+        state = self._state
+        if data is not None:
+            # The last data keeps showing while the circuit breaker holds the requests to the server
+            self._state = "Online" if self._client.breaker.available else "error"
+            # The client hands back the same list when the library did not change
+            digest = self._data_fingerprint if data is self.data else fingerprint(data)
+            if digest != self._data_fingerprint:
+                self.data = data
+                self._data_fingerprint = digest
+                self.last_changed = dt_util.utcnow()
+                self._changed = True
             else:
-                card_item["runtime"] = ""
-
-            if "Genres" in show:
-                card_item["genres"] = ", ".join(show["Genres"][:3])
-
-            if "Studios" in show and len(show["Studios"]) > 0:
-                card_item["studio"] = show["Studios"][0]["Name"]
-
-            if "CommunityRating" in show:
-                card_item["rating"] = "{} {:.1f}".format(
-                    "\u2605", # Star character
-                    show.get("CommunityRating", ''),
-                )
-
-            # Add summary
-            if "Overview" in show:
-                card_item["summary"] = show["Overview"]
-                
-            # Add trailer
-            if "RemoteTrailers" in show and len(show["RemoteTrailers"]) > 0:
-                card_item["trailer"] = show["RemoteTrailers"][0]["Url"]
-                
-            card_item["poster"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                show["Id"], "Backdrop" if self.use_backdrop else "Primary"
-            )
-            # Add fanart
-            card_item["fanart"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                show["Id"], "Backdrop"
-            )
-            
-            # Add deep_link
-            base_url = "http{0}://{1}:{2}".format(
-                "s" if self.hass.data[DOMAIN_DATA]["client"].ssl else "",
-                self.hass.data[DOMAIN_DATA]["client"].host,
-                self.hass.data[DOMAIN_DATA]["client"].port
-            )
-            card_item["deep_link"] = "{0}/web/index.html#!/details?id={1}".format(
-                base_url, show["Id"]
-            )
-            card_item["id"] = show.get("Id", "")
-
-            card_json.append(card_item)
-
-        return {
-            "data": card_json,
-            "attribution": ATTRIBUTION
+                self._unchanged = True
+        else:
+            self._state = "error"
+            _LOGGER.error("ERROR")
+        if self._state != state:
+            self._changed = True
+
+
+class EmbyDiagnosticsSensor(Entity):
+    """Timings, bytes received and errors of the client, per library."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_icon = "mdi:timer-outline"
+    # The statistics change with every poll, only the p95 in the state is worth keeping in the history
+    _unrecorded_attributes = frozenset(
+        {
+            "spans",
+            "libraries",
+            "attribute_bytes",
+            "skipped_writes",
+            "card_cache",
+            "response_cache",
+            "data",
+            "artwork",
+            "scheduler",
+            "breaker",
+            "push",
         }
+    )
+    restored = False
 
-    def handle_music(self):
-        """Return the state attributes."""
-
-        attributes = {}
-        default = MUSIC_DEFAULT
-        card_json = []
-
-        card_json.append(default)
-
-        for show in self.data:
-
-            card_item = {}
-            card_item["title"] = show["Name"]
-            card_item["airdate"] = show.get("PremiereDate", datetime.now().isoformat())
-
-            if "Artists" in show and len(show["Artists"]) > 0:
-                card_item["studio"] = ", ".join(show["Artists"][:3])
-
-            if "RunTimeTicks" in show:
-                timeobject = timedelta(microseconds=show["RunTimeTicks"] / 10)
-                card_item["runtime"] = timeobject.total_seconds() / 60
-            else:
-                card_item["runtime"] = ""
-
-            if "Genres" in show:
-                card_item["genres"] = ", ".join(show["Genres"][:3])
-
-            card_item["release"] = str(show.get("ProductionYear", ""))
-            
-            if "ParentIndexNumber" in show and "IndexNumber" in show:
-                card_item["number"] = "S{:02d}E{:02d}".format(
-                    show["ParentIndexNumber"], show["IndexNumber"]
-                )
-            else:
-                card_item["number"] = show.get("ProductionYear", "")
-
-            if "CommunityRating" in show:
-                card_item["rating"] = "{} {:.1f}".format(
-                    "\u2605", # Star character
-                    show.get("CommunityRating", ''),
-                )
-
-            # Add summary
-            if "Overview" in show:
-                card_item["summary"] = show["Overview"]
-                
-            card_item["poster"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                show["Id"], "Primary"
-            )
-            # Add fanart
-            card_item["fanart"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                show["Id"], "Backdrop"
-            )
-            
-            # Add deep_link (no trailer for music)
-            base_url = "http{0}://{1}:{2}".format(
-                "s" if self.hass.data[DOMAIN_DATA]["client"].ssl else "",
-                self.hass.data[DOMAIN_DATA]["client"].host,
-                self.hass.data[DOMAIN_DATA]["client"].port
-            )
-            card_item["deep_link"] = "{0}/web/index.html#!/details?id={1}".format(
-                base_url, show["Id"]
-            )
+    def __init__(self, client, suffix="", artwork=None):
+        self._client = client
+        self._artwork = artwork
+        self.entity_id = sensor.ENTITY_ID_FORMAT.format(
+            "emby_latest_diagnostics" + (suffix or "_" + re.sub(r"\W+", "_", client.host).lower())
+        )
 
-            card_json.append(card_item)
+    @property
+    def name(self):
+        return "Emby Latest Media diagnostics {0}".format(self._client.host)
 
-        return {
-            "data": card_json,
-            "attribution": ATTRIBUTION
-        }
+    @property
+    def state(self):
+        """p95 of the Latest requests, in ms."""
+        return self._client.diagnostics.as_dict()["spans"].get("network", {}).get("p95_ms")
 
     @property
     def extra_state_attributes(self):
-        """Return the state attributes."""
-
-        attributes = {}
-        default = OTHER_DEFAULT
-        card_json = []
-
-        if len(self.data) == 0:
-            return attributes
-        elif self.data[0]["Type"] == "Episode":
-            return self.handle_tv_episodes()
-        elif self.data[0]["Type"] == "Series":
-            return self.handle_tv_show()
-        elif self.data[0]["Type"] == "Movie":
-            return self.handle_movie()
-        elif self.data[0]["Type"] == "MusicAlbum" or "Audio":
-            return self.handle_music()
-        else:
-            card_json.append(default)
-
-            # for show in self.data[self._category_id]:
-            for show in self.data:
-
-                card_item = {}
-                card_item["title"] = show["Name"]
-                card_item["airdate"] = show.get("PremiereDate", datetime.now().isoformat())
-
-                card_item["episode"] = show.get("OfficialRating", "")
-                card_item["officialrating"] = show.get("OfficialRating", "")
-
-                if "Genres" in show:
-                    card_item["genres"] = ", ".join(show["Genres"][:3])
-
-                if "RunTimeTicks" in show:
-                    timeobject = timedelta(microseconds=show["RunTimeTicks"] / 10)
-                    card_item["runtime"] = timeobject.total_seconds() / 60
-                else:
-                    card_item["runtime"] = ""
-
-                if "Artists" in show and len(show["Artists"]) > 0:
-                    card_item["studio"] = ", ".join(show["Artists"][:3])
-
-                if "ParentIndexNumber" in show and "IndexNumber" in show:
-                    card_item["number"] = "S{:02d}E{:02d}".format(
-                        show["ParentIndexNumber"], show["IndexNumber"]
-                    )
-                else:
-                    card_item["number"] = show.get("ProductionYear", "")
-
-                card_item["poster"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                    show["Id"], "Primary"
-                )
-
-                card_item["rating"] = "%s %s" % (
-                    "\u2605",  # Star character
-                    show.get("CommunityRating", ""),
-                )
-
-                # Add summary
-                if "Overview" in show:
-                    card_item["summary"] = show["Overview"]
-                    
-                # Add trailer for non-music content
-                if ("RemoteTrailers" in show and 
-                    len(show["RemoteTrailers"]) > 0 and 
-                    show.get("Type") not in ["MusicAlbum", "Audio"]):
-                    card_item["trailer"] = show["RemoteTrailers"][0]["Url"]
-                
-                # Add fanart
-                card_item["fanart"] = self.hass.data[DOMAIN_DATA]["client"].get_image_url(
-                    show["Id"], "Backdrop"
-                )
-                
-                # Add deep_link
-                base_url = "http{0}://{1}:{2}".format(
-                    "s" if self.hass.data[DOMAIN_DATA]["client"].ssl else "",
-                    self.hass.data[DOMAIN_DATA]["client"].host,
-                    self.hass.data[DOMAIN_DATA]["client"].port
-                )
-                card_item["deep_link"] = "{0}/web/index.html#!/details?id={1}".format(
-                    base_url, show["Id"]
-                )
-
-                card_json.append(card_item)
-
-            return {
-                "data": card_json,
-                "attribution": ATTRIBUTION
-            }
-        
-        return attributes
-
-    def update(self):
-        if isinstance(self.category_id, str): 
-            data = self._client.get_data(self.category_id)
-        else:
-            data = []
-            for element in self.category_id:
-                for res in self._client.get_data(element):
-                    data.append(res)
-            data.sort(key=lambda item:item['DateCreated'], reverse=True) #as we added all libraries we now resort to get the newest at top
+        return {
+            **self._client.diagnostics.as_dict(),
+            "card_cache": self._client.card_cache.stats(),
+            "response_cache": self._client.response_cache.stats(),
+            "data": self._client.data.stats(),
+            "artwork": self._artwork.stats() if self._artwork else None,
+            "scheduler": self._client.scheduler.as_dict(),
+            "breaker": self._client.breaker.as_dict(),
+            "push": self._client.push.as_dict() if self._client.push else None,
+        }
 
-        if data is not None:
-            self._state = "Online"
-            self.data = data
-        else:
-            self._state = "error"
-            _LOGGER.error("ERROR")
+    async def async_update(self):
+        """The statistics are read from the client when the state is written."""
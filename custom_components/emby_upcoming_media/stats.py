@@ -0,0 +1,117 @@
+"""Timing and error statistics of the hot paths."""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW = 100
+
+
+class RollingHistogram:
+    """The last WINDOW samples of a duration, in seconds."""
+
+    def __init__(self, window=WINDOW):
+        """Init."""
+        self.count = 0
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self._samples.append(seconds)
+
+    def percentile(self, percent):
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))]
+
+    def as_dict(self):
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "count": self.count,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+
+class LibraryStats:
+    """Network and decode timings, bytes received, errors and short-circuited requests of one library."""
+
+    def __init__(self):
+        """Init."""
+        self.spans = {}
+        self.bytes_received = 0
+        self.errors = 0
+        self.short_circuits = 0
+
+    def as_dict(self):
+        stats = {name: span.as_dict() for name, span in self.spans.items()}
+        stats["bytes_received"] = self.bytes_received
+        stats["errors"] = self.errors
+        stats["short_circuits"] = self.short_circuits
+        return stats
+
+
+class Diagnostics:
+    """Rolling timing spans of a client, overall and per library, and the attribute size and skipped state writes of its sensors."""
+
+    def __init__(self):
+        """Init."""
+        self.spans = {}
+        self.libraries = {}
+        self.attribute_bytes = {}
+        self.skipped_writes = {}
+        self._lock = threading.Lock()
+
+    def _library(self, library):
+        if library not in self.libraries:
+            self.libraries[library] = LibraryStats()
+        return self.libraries[library]
+
+    def record(self, name, seconds, library=None):
+        """Add a duration to the span name, and to the one of library if given."""
+        with self._lock:
+            self.spans.setdefault(name, RollingHistogram()).add(seconds)
+            if library is not None:
+                self._library(library).spans.setdefault(name, RollingHistogram()).add(seconds)
+
+    @contextmanager
+    def span(self, name, library=None):
+        """Time the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, library)
+
+    def add_bytes(self, library, count):
+        with self._lock:
+            self._library(library).bytes_received += count
+
+    def add_error(self, library):
+        with self._lock:
+            self._library(library).errors += 1
+
+    def add_short_circuit(self, library):
+        """Count a request answered with the last data while the server is unreachable."""
+        with self._lock:
+            self._library(library).short_circuits += 1
+
+    def set_attribute_bytes(self, entity_id, count):
+        with self._lock:
+            self.attribute_bytes[entity_id] = count
+
+    def add_skipped_write(self, entity_id):
+        """Count a refresh that left the content and state of a sensor unchanged."""
+        with self._lock:
+            self.skipped_writes[entity_id] = self.skipped_writes.get(entity_id, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "spans": {name: span.as_dict() for name, span in self.spans.items()},
+                "libraries": {library: stats.as_dict() for library, stats in self.libraries.items()},
+                "attribute_bytes": dict(self.attribute_bytes),
+                "skipped_writes": dict(self.skipped_writes),
+            }